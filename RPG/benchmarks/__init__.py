@@ -0,0 +1,9 @@
+"""
+Pathfinder RPG - Benchmarks
+Ejecutar desde el directorio RPG: python -m benchmarks.<nombre>
+
+    datagen             datos sintéticos reproducibles a la escala pedida
+    loadgen             carga por escenarios con percentiles y JSON de referencia
+    check_query_plans   planes de consulta sin recorridos completos ni B-tree temporales
+    bench_pool, bench_async, bench_json   microbenchmarks de cambios concretos
+"""
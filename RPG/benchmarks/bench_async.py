@@ -0,0 +1,130 @@
+"""
+Benchmark: latencia con muchos clientes concurrentes, threadpool vs. executor
+
+Arranca el servidor con uvicorn en cada modo de PATHFINDER_DB_MODE sobre la
+misma base de datos temporal y mide p50/p99 con N clientes simultáneos.
+
+Uso (desde RPG/):
+    python -m benchmarks.bench_async --clientes 100 500 1000 --peticiones 5
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+RPG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODOS = ("threadpool", "executor")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, database, port):
+    env = dict(os.environ, PATHFINDER_DB=database, PATHFINDER_DB_MODE=mode)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "pathfinder_api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=RPG_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base, trust_env=False) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"el servidor no arrancó en {base}")
+
+
+async def seed(base, personajes=20, items=10):
+    async with httpx.AsyncClient(base_url=base, trust_env=False) as client:
+        for i in range(personajes):
+            pid = (await client.post("/api/personajes", json={"nombre": f"Bench {i}"})).json()["id"]
+            for j in range(items):
+                await client.post("/api/inventario", json={"personaje_id": pid, "item": f"Item {j}", "peso": 1.5})
+
+
+async def load(base, clientes, peticiones, personajes):
+    """`clientes` corrutinas concurrentes, cada una con `peticiones` GET seguidos"""
+    latencias = []
+    errores = 0
+    limits = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60, trust_env=False) as client:
+        async def cliente(n):
+            nonlocal errores
+            for i in range(peticiones):
+                pid = (n + i) % personajes + 1
+                path = f"/api/personajes/{pid}" if i % 2 else f"/api/inventario/{pid}"
+                start = time.perf_counter()
+                try:
+                    (await client.get(path)).raise_for_status()
+                except httpx.HTTPError:
+                    errores += 1
+                    continue
+                latencias.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(cliente(n) for n in range(clientes)))
+        elapsed = time.perf_counter() - start
+    latencias = sorted(latencias) or [float("nan")]
+    return {
+        "p50": latencias[len(latencias) // 2] * 1000,
+        "p99": latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000,
+        "rps": (clientes * peticiones - errores) / elapsed,
+        "errores": errores,
+    }
+
+
+async def bench_mode(mode, database, args, seeded):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_server(mode, database, port)
+    try:
+        await wait_ready(base)
+        if not seeded:
+            await seed(base, args.personajes)
+        await load(base, 50, 2, args.personajes)  # calentamiento
+        return {c: await load(base, c, args.peticiones, args.personajes) for c in args.clientes}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def main_async(args):
+    database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    resultados = {}
+    for i, mode in enumerate(MODOS):
+        resultados[mode] = await bench_mode(mode, database, args, seeded=i > 0)
+
+    print(f"{'clientes':>8}  {'modo':<10}  {'p50 ms':>8}  {'p99 ms':>8}  {'req/s':>8}  {'errores':>7}")
+    for c in args.clientes:
+        for mode in MODOS:
+            r = resultados[mode][c]
+            print(f"{c:>8}  {mode:<10}  {r['p50']:8.1f}  {r['p99']:8.1f}  {r['rps']:8.1f}  {r['errores']:7d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--peticiones", type=int, default=5)
+    parser.add_argument("--personajes", type=int, default=20)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Microbenchmark: serialización de un listado de 10k filas
+
+Compara el camino anterior (dict por fila + jsonable_encoder + json.dumps),
+dict por fila + orjson y list_json (objetos construidos en SQLite).
+
+Uso (desde RPG/):
+    python -m benchmarks.bench_json --filas 10000
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from pathfinder_db import _list_query, list_json
+from pathfinder_json import dumps
+
+
+def build(filas):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE objetos_predefinidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, tipo TEXT,
+            peso REAL, valor INTEGER, descripcion TEXT, imagen TEXT
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO objetos_predefinidos (nombre, tipo, peso, valor, descripcion, imagen) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"Objeto {i} ñ", "Arma", 1.5, i, "Descripción \"larga\" " * 4, None) for i in range(filas)],
+    )
+    return conn
+
+
+def list_rows(conn):
+    """Filas sqlite3.Row del mismo listado que list_json"""
+    sql, params, selected = _list_query(conn, "objetos_predefinidos", ("nombre", "id"), None, None, None, None)
+    return conn.execute(f"SELECT {', '.join(selected)} {sql}", params).fetchall()
+
+
+def anterior(conn):
+    rows = list_rows(conn)
+    return json.dumps(jsonable_encoder([dict(row) for row in rows]), ensure_ascii=False).encode("utf-8")
+
+
+def con_orjson(conn):
+    rows = list_rows(conn)
+    return dumps([dict(row) for row in rows])
+
+
+def con_sqlite(conn):
+    body, _ = list_json(conn, "objetos_predefinidos", ("nombre", "id"))
+    return body
+
+
+def measure(fn, conn, repeticiones):
+    fn(conn)
+    start = time.perf_counter()
+    for _ in range(repeticiones):
+        fn(conn)
+    return (time.perf_counter() - start) / repeticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = build(args.filas)
+    assert json.loads(anterior(conn)) == json.loads(con_sqlite(conn))
+
+    base = measure(anterior, conn, args.repeticiones)
+    print(f"dict + jsonable_encoder: {base:8.2f} ms")
+    for nombre, fn in (("dict + orjson", con_orjson), ("list_json (SQLite)", con_sqlite)):
+        ms = measure(fn, conn, args.repeticiones)
+        print(f"{nombre + ':':24} {ms:8.2f} ms  ({base / ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
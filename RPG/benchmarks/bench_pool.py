@@ -0,0 +1,87 @@
+"""
+Benchmark: pool de conexiones vs. una conexión nueva por petición
+
+Uso (desde RPG/):
+    python -m benchmarks.bench_pool --requests 2000 --workers 8
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# La base de datos del benchmark es temporal para no tocar la real
+os.environ.setdefault("PATHFINDER_DB", os.path.join(tempfile.mkdtemp(), "bench.db"))
+# Los handlers toman la conexión de pathfinder_db.pool solo en modo threadpool
+os.environ.setdefault("PATHFINDER_DB_MODE", "threadpool")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import pathfinder_api  # noqa: E402
+import pathfinder_db  # noqa: E402
+from pathfinder_db import DATABASE  # noqa: E402
+
+
+class LegacyPool:
+    """Comportamiento anterior: abrir y cerrar una conexión en cada petición"""
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(DATABASE, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def seed(client, personajes=20, items=10):
+    for i in range(personajes):
+        pid = client.post("/api/personajes", json={"nombre": f"Bench {i}"}).json()["id"]
+        for j in range(items):
+            client.post("/api/inventario", json={"personaje_id": pid, "item": f"Item {j}", "peso": 1.5})
+
+
+def run(client, total, workers, personajes):
+    paths = []
+    for i in range(total):
+        pid = i % personajes + 1
+        paths.append(f"/api/personajes/{pid}" if i % 2 else f"/api/inventario/{pid}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for response in executor.map(client.get, paths):
+            response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--personajes", type=int, default=20)
+    args = parser.parse_args()
+
+    pooled_pool = pathfinder_db.pool
+    with TestClient(pathfinder_api.app) as client:
+        seed(client, args.personajes)
+
+        pathfinder_db.pool = LegacyPool()
+        run(client, 100, args.workers, args.personajes)  # calentamiento
+        legacy = run(client, args.requests, args.workers, args.personajes)
+
+        pathfinder_db.pool = pooled_pool
+        run(client, 100, args.workers, args.personajes)
+        pooled = run(client, args.requests, args.workers, args.personajes)
+
+    print(f"Conexión por petición: {legacy:8.1f} req/s")
+    print(f"Pool de conexiones:    {pooled:8.1f} req/s")
+    print(f"Mejora:                {pooled / legacy:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
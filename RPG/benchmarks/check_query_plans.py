@@ -0,0 +1,179 @@
+"""
+Comprobación de planes de consulta (EXPLAIN QUERY PLAN)
+
+Crea una base de datos sintética (100k personajes, 1M objetos de inventario
+por defecto), recorre los endpoints de la API registrando cada sentencia SQL
+que ejecutan y revisa su plan. Falla (código de salida 1) si una consulta
+con WHERE recorre una tabla completa o si cualquiera ordena con un B-tree
+temporal.
+
+tests/test_query_plans.py la ejecuta con datos pequeños dentro de pytest.
+
+Uso (desde RPG/):
+    python -m benchmarks.check_query_plans
+    python -m benchmarks.check_query_plans --personajes 2000 --inventario 20000
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+# La base de datos es temporal para no tocar la real
+os.environ["PATHFINDER_DB"] = os.path.join(tempfile.mkdtemp(), "plans.db")
+
+import pathfinder_db  # noqa: E402
+
+CLASES = ("Guerrero", "Mago", "Pícaro", "Clérigo", "Explorador")
+
+# Sentencias que no son consultas sobre tablas
+_IGNORAR = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA|--)", re.IGNORECASE)
+
+# Una tabla de verdad recorrida entera (las de FTS5 y sus tablas internas no cuentan)
+_SCAN = re.compile(r"^SCAN (\w+)(?! VIRTUAL TABLE)(?: USING (?:COVERING )?INDEX)?")
+
+statements = []
+
+
+def _traced_connect(connect):
+    def traced(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+    return traced
+
+
+def seed(conn, personajes, inventario):
+    """Genera los datos con CTE recursivas, sin pasar por Python fila a fila"""
+    with pathfinder_db.transaction(conn):
+        conn.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {personajes})
+            INSERT INTO personajes (nombre, clase, hp_actual, oro, notas)
+            SELECT 'Personaje ' || i, {_case("i", CLASES)}, 10, i % 500, 'notas ' || i FROM n
+        ''')
+        conn.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {inventario})
+            INSERT INTO inventario (personaje_id, item, cantidad, peso, valor, descripcion)
+            SELECT (i % {personajes}) + 1, 'Objeto ' || (i % 200), 1 + i % 5, (i % 10) * 0.5, i % 100,
+                   'Defensa: +' || (i % 4) FROM n
+        ''')
+        conn.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {personajes * 3})
+            INSERT INTO habilidades (personaje_id, nombre, rango)
+            SELECT (i % {personajes}) + 1, 'Habilidad ' || (i % 30), i % 5 FROM n
+        ''')
+        for table, extra in (("objetos_predefinidos", "tipo"), ("armor_predefinidos", "tipo"),
+                             ("weapons_predefinidos", "tipo"), ("habilidades_predefinidas", "clase")):
+            conn.execute(f'''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000)
+                INSERT INTO {table} (nombre, {extra}) SELECT 'Objeto ' || i, 'Tipo ' || (i % 7) FROM n
+            ''')
+    conn.execute("ANALYZE")
+
+
+def _case(expr, values):
+    whens = " ".join(f"WHEN {i} THEN '{v}'" for i, v in enumerate(values))
+    return f"CASE {expr} % {len(values)} {whens} END"
+
+
+def exercise(client, personajes):
+    """Llama a los endpoints que leen y escriben personajes y bibliotecas"""
+    # Un personaje cualquiera que no sea el último: también se borra el siguiente
+    pid = min(4242, personajes - 1)
+    calls = [
+        ("GET", "/api/personajes", {"limit": 50}),
+        ("GET", "/api/personajes", {"clase": "Mago", "limit": 50}),
+        ("GET", f"/api/personajes/{pid}", None),
+        ("GET", f"/api/personajes/{pid}/sheet", None),
+        ("GET", f"/api/personajes/{pid}/stats", None),
+        ("GET", f"/api/inventario/{pid}", None),
+        ("GET", f"/api/habilidades/{pid}", None),
+        ("GET", "/api/search", {"q": "personaje 42"}),
+    ]
+    for path, filtro in (("objetos", "tipo"), ("armor", "tipo"), ("weapons", "tipo"), ("habilidades-lib", "clase")):
+        calls.append(("GET", f"/api/{path}", {"limit": 50}))
+        calls.append(("GET", f"/api/{path}", {filtro: "Tipo 3", "limit": 50}))
+    for method, path, params in calls:
+        client.request(method, path, params=params).raise_for_status()
+
+    # Segunda página: comparación por cursor
+    first = client.get("/api/objetos", params={"limit": 50})
+    client.get("/api/objetos", params={"limit": 50, "after": first.headers["X-Next-Cursor"]}).raise_for_status()
+    first = client.get("/api/personajes", params={"limit": 50})
+    client.get("/api/personajes", params={"limit": 50, "after": first.headers["X-Next-Cursor"]}).raise_for_status()
+
+    item = client.get(f"/api/inventario/{pid}").json()[0]["id"]
+    writes = [
+        ("PATCH", f"/api/personajes/{pid}", {"hp_actual": 3}),
+        ("PATCH", f"/api/personajes/{pid}", {"equip_armadura": item, "fuerza": 14}),
+        ("PUT", f"/api/inventario/{item}", {"cantidad": 2}),
+        ("POST", "/api/inventario", {"personaje_id": pid, "item": "Cuerda"}),
+        ("POST", "/api/habilidades", {"personaje_id": pid, "nombre": "Trepar"}),
+        ("DELETE", f"/api/inventario/{item}", None),
+        ("DELETE", f"/api/personajes/{pid + 1}", None),
+    ]
+    for method, path, body in writes:
+        client.request(method, path, json=body).raise_for_status()
+
+
+def check(conn, sql):
+    """Devuelve los problemas del plan de `sql` (lista vacía si está bien)"""
+    problems = []
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    # Subconsultas ya materializadas: recorrerlas no toca ninguna tabla
+    subqueries = {d.split()[-1] for d in plan if d.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+    for detail in plan:
+        if "TEMP B-TREE" in detail:
+            problems.append(detail)
+        match = _SCAN.match(detail)
+        # Sin WHERE la consulta lee la tabla entera a propósito (exportación, listado completo)
+        if (match and match.group(1) not in subqueries and " WHERE " in sql.upper()
+                and "INDEX" not in detail):
+            problems.append(detail)
+    return plan, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--personajes", type=int, default=100_000)
+    parser.add_argument("--inventario", type=int, default=1_000_000)
+    parser.add_argument("-v", "--verbose", action="store_true", help="muestra el plan de cada consulta")
+    args = parser.parse_args()
+
+    pathfinder_db.connect = _traced_connect(pathfinder_db.connect)
+
+    from fastapi.testclient import TestClient
+
+    import pathfinder_api
+
+    start = time.perf_counter()
+    with pathfinder_db.pool.connection() as conn:
+        seed(conn, args.personajes, args.inventario)
+    print(f"Datos sintéticos: {args.personajes} personajes, {args.inventario} objetos "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    statements.clear()
+    with TestClient(pathfinder_api.app) as client:
+        exercise(client, args.personajes)
+
+    queries = list(dict.fromkeys(s.strip() for s in statements if not _IGNORAR.match(s)))
+    failures = 0
+    # El pool ya está cerrado al apagar la app: conexión propia, sin traza
+    with sqlite3.connect(pathfinder_db.DATABASE) as conn:
+        for sql in queries:
+            plan, problems = check(conn, sql)
+            if problems or args.verbose:
+                print(("FALLA  " if problems else "ok     ") + " ".join(sql.split())[:160])
+                for detail in plan:
+                    print(f"         {detail}")
+            failures += bool(problems)
+
+    print(f"{len(queries)} consultas revisadas, {failures} con recorrido completo u ordenación temporal")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
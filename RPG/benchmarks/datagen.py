@@ -0,0 +1,137 @@
+"""
+Generador de datos sintéticos reproducibles
+
+Personajes con inventario y habilidades, y las cuatro bibliotecas (objetos,
+armaduras, armas y habilidades), a la escala pedida. Con la misma semilla
+se obtiene exactamente la misma base de datos.
+
+Uso (desde RPG/):
+    python -m benchmarks.datagen --db /tmp/bench.db --personajes 1000 --seed 42
+"""
+
+import argparse
+import random
+import time
+
+CLASES = ("Guerrero", "Mago", "Pícaro", "Clérigo", "Explorador", "Bardo", "Paladín", "Druida")
+RAZAS = ("Humano", "Elfo", "Enano", "Mediano", "Gnomo", "Semiorco", "Semielfo")
+ATRIBUTOS = ("fuerza", "destreza", "constitucion", "inteligencia", "sabiduria", "carisma")
+ENTRENAMIENTO = ("Básico", "Entrenado", "Experto", "Maestro")
+SILABAS = ("ka", "ra", "vel", "do", "mir", "an", "tor", "eli", "zor", "en", "ia", "bran", "sel", "um")
+
+TIPOS_OBJETO = ("Misc", "Poción", "Herramienta", "Munición", "Pergamino", "Gema")
+TIPOS_ARMADURA = ("Ligera", "Intermedia", "Pesada", "Escudo")
+TIPOS_ARMA = ("Light melee", "One-handed melee", "Two-handed melee", "Ranged")
+CLASES_ARMA = ("Simple", "Marcial", "Exótica")
+DADOS = ("1d4", "1d6", "1d8", "1d10", "1d12", "2d4", "2d6")
+
+
+def nombre(rng, partes=(2, 3)):
+    return "".join(rng.choice(SILABAS) for _ in range(rng.randint(*partes))).capitalize()
+
+
+def _libraries(rng, n):
+    objetos = [(f"{nombre(rng)} {i}", rng.choice(TIPOS_OBJETO), round(rng.uniform(0, 10), 1),
+                rng.randint(1, 500), f"Objeto de prueba {i}") for i in range(n)]
+    armaduras = [(f"Armadura {nombre(rng)} {i}", rng.choice(TIPOS_ARMADURA), rng.randint(1, 9),
+                  round(rng.uniform(5, 50), 1), rng.randint(5, 2000), f"Defensa: +{rng.randint(1, 9)}")
+                 for i in range(n)]
+    armas = [(f"Arma {nombre(rng)} {i}", rng.choice(TIPOS_ARMA), rng.choice(CLASES_ARMA), rng.choice(DADOS),
+              rng.choice((18, 19, 20)), rng.choice((2, 3, 4)), round(rng.uniform(1, 15), 1),
+              rng.randint(1, 1000), "") for i in range(n)]
+    habilidades = [(f"Habilidad {nombre(rng)} {i}", rng.choice(CLASES), rng.randint(1, 20),
+                    rng.choice(ENTRENAMIENTO), rng.choice(ATRIBUTOS)) for i in range(n)]
+    return objetos, armaduras, armas, habilidades
+
+
+def generate(conn, seed=42, personajes=1000, objetos=20, habilidades=8, biblioteca=500):
+    """Llena la base de datos (ya migrada); devuelve el recuento por tabla"""
+    import pathfinder_stats as stats
+    from pathfinder_db import transaction
+
+    rng = random.Random(seed)
+    lib_objetos, lib_armaduras, lib_armas, lib_habilidades = _libraries(rng, biblioteca)
+
+    with transaction(conn):
+        conn.executemany("INSERT INTO objetos_predefinidos (nombre, tipo, peso, valor, descripcion) "
+                         "VALUES (?, ?, ?, ?, ?)", lib_objetos)
+        conn.executemany("INSERT INTO armor_predefinidos (nombre, tipo, defensa, peso, valor, descripcion) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", lib_armaduras)
+        conn.executemany("INSERT INTO weapons_predefinidos (nombre, tipo, clase, damage, crit_rango, crit_mult, "
+                         "peso, valor, descripcion) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", lib_armas)
+        conn.executemany("INSERT INTO habilidades_predefinidas (nombre, clase, nivel_minimo, entrenamiento, atributo) "
+                         "VALUES (?, ?, ?, ?, ?)", lib_habilidades)
+
+        # El inventario copia objetos de las bibliotecas, como hace el frontend
+        copiables = [(o[0], o[2], o[4], o[3]) for o in lib_objetos] + \
+                    [(a[0], a[3], a[5], a[4]) for a in lib_armaduras]
+        ids = []
+        for i in range(personajes):
+            hp = rng.randint(8, 120)
+            cursor = conn.execute(
+                "INSERT INTO personajes (nombre, clase, raza, nivel, hp_max, hp_actual, oro, fuerza, destreza, "
+                "constitucion, inteligencia, sabiduria, carisma, notas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (f"{nombre(rng)} {nombre(rng)}", rng.choice(CLASES), rng.choice(RAZAS), rng.randint(1, 20),
+                 hp, rng.randint(0, hp), rng.randint(0, 5000), *(rng.randint(7, 18) for _ in ATRIBUTOS),
+                 f"Notas de campaña {i}"),
+            )
+            pid = cursor.lastrowid
+            ids.append(pid)
+            items = [(pid, item, rng.randint(1, 20), peso, descripcion, valor)
+                     for item, peso, descripcion, valor in rng.sample(copiables, min(objetos, len(copiables)))]
+            conn.executemany("INSERT INTO inventario (personaje_id, item, cantidad, peso, descripcion, valor) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", items)
+            skills = [(pid, h[0], h[4], rng.randint(0, 10), h[3])
+                      for h in rng.sample(lib_habilidades, min(habilidades, len(lib_habilidades)))]
+            conn.executemany("INSERT INTO habilidades (personaje_id, nombre, atributo, rango, entrenamiento) "
+                             "VALUES (?, ?, ?, ?, ?)", skills)
+        for pid in ids:
+            stats.refresh(conn, pid)
+    conn.execute("ANALYZE")
+
+    tablas = ("personajes", "inventario", "habilidades", "objetos_predefinidos", "armor_predefinidos",
+              "weapons_predefinidos", "habilidades_predefinidas")
+    return {t: conn.execute(f"SELECT count(*) FROM {t}").fetchone()[0] for t in tablas}
+
+
+def create_database(path, **kwargs):
+    """Crea una base de datos nueva en `path`, la migra y la llena"""
+    import pathfinder_migrations as migrations
+    from pathfinder_db import STORAGE_PROFILE, connect
+
+    conn = connect(path, STORAGE_PROFILE)
+    try:
+        migrations.migrate(conn)
+        return generate(conn, **kwargs)
+    finally:
+        conn.close()
+
+
+def add_arguments(parser):
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--personajes", type=int, default=1000)
+    parser.add_argument("--objetos", type=int, default=20, help="objetos de inventario por personaje")
+    parser.add_argument("--habilidades", type=int, default=8, help="habilidades por personaje")
+    parser.add_argument("--biblioteca", type=int, default=500, help="entradas en cada biblioteca")
+
+
+def scale(args):
+    return {"seed": args.seed, "personajes": args.personajes, "objetos": args.objetos,
+            "habilidades": args.habilidades, "biblioteca": args.biblioteca}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="ruta de la base de datos a crear")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = create_database(args.db, **scale(args))
+    for table, count in counts.items():
+        print(f"{table:26} {count:>9}")
+    print(f"Generado en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
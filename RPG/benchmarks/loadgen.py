@@ -0,0 +1,263 @@
+"""
+Pruebas de carga por escenarios
+
+Escenarios:
+    navegar      listados paginados, fichas completas y bibliotecas
+    combate      ticks de puntos de golpe (PATCH), munición y rondas en /api/batch
+    bibliotecas  altas, ediciones y bajas de objetos seguidas de listados
+
+Por defecto la app corre en el mismo proceso (httpx.ASGITransport) sobre una
+base de datos generada con benchmarks.datagen; con --url se ataca un
+servidor uvicorn ya arrancado (sus datos deben generarse aparte con datagen).
+Informa de peticiones por segundo y percentiles de latencia, guarda el
+resultado como JSON de referencia y compara con una referencia anterior.
+
+Uso (desde RPG/):
+    python -m benchmarks.loadgen --duracion 10 --concurrencia 32 --guardar base.json
+    python -m benchmarks.loadgen --duracion 10 --concurrencia 32 --comparar base.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import datagen
+
+
+# ==================== ESCENARIOS ====================
+# Cada escenario es una corrutina que hace una "acción de usuario" con una o
+# varias peticiones; cada petición se mide por separado con su etiqueta.
+
+async def navegar(session, rng, ctx):
+    pid = rng.randint(1, ctx["personajes"])
+    await session.get("personajes", "/api/personajes", params={"limit": 50})
+    await session.get("ficha", f"/api/personajes/{pid}/sheet")
+    biblioteca = rng.choice(("objetos", "armor", "weapons", "habilidades-lib"))
+    await session.get("biblioteca", f"/api/{biblioteca}", params={"limit": 100})
+
+
+async def combate(session, rng, ctx):
+    pids = rng.sample(range(1, ctx["personajes"] + 1), 3)
+    for pid in pids:
+        await session.patch("tick_hp", f"/api/personajes/{pid}", json={"hp_actual": rng.randint(0, 50)})
+    inventario = (await session.get("inventario", f"/api/inventario/{pids[0]}")).json()
+    if inventario:
+        item = rng.choice(inventario)
+        await session.put("municion", f"/api/inventario/{item['id']}",
+                          json={"cantidad": max(item["cantidad"] - 1, 0)})
+    operaciones = [{"op": "personaje.update", "id": pid, "datos": {"hp_actual": rng.randint(0, 50)}} for pid in pids]
+    operaciones.append({"op": "inventario.create", "datos": {"personaje_id": pids[1], "item": "Botín", "peso": 1}})
+    await session.post("ronda_batch", "/api/batch", json={"operaciones": operaciones})
+
+
+async def bibliotecas(session, rng, ctx):
+    nuevo = {"nombre": f"Objeto carga {rng.randint(0, 10**9)}", "tipo": "Misc", "peso": 1.5, "valor": 10}
+    oid = (await session.post("crear_objeto", "/api/objetos", json=nuevo)).json()["id"]
+    await session.put("editar_objeto", f"/api/objetos/{oid}", json={**nuevo, "valor": 20})
+    await session.get("listar_objetos", "/api/objetos", params={"limit": 100})
+    await session.delete("borrar_objeto", f"/api/objetos/{oid}")
+
+
+SCENARIOS = {"navegar": navegar, "combate": combate, "bibliotecas": bibliotecas}
+
+
+# ==================== MEDICIÓN ====================
+
+class Session:
+    """Envuelve el cliente httpx y anota la latencia de cada petición"""
+
+    def __init__(self, client, latencias, errores):
+        self.client = client
+        self.latencias = latencias
+        self.errores = errores
+
+    async def request(self, etiqueta, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            self.errores[etiqueta] = self.errores.get(etiqueta, 0) + 1
+            response.raise_for_status()
+        self.latencias.setdefault(etiqueta, []).append(elapsed)
+        return response
+
+    def get(self, etiqueta, url, **kwargs):
+        return self.request(etiqueta, "GET", url, **kwargs)
+
+    def post(self, etiqueta, url, **kwargs):
+        return self.request(etiqueta, "POST", url, **kwargs)
+
+    def put(self, etiqueta, url, **kwargs):
+        return self.request(etiqueta, "PUT", url, **kwargs)
+
+    def patch(self, etiqueta, url, **kwargs):
+        return self.request(etiqueta, "PATCH", url, **kwargs)
+
+    def delete(self, etiqueta, url, **kwargs):
+        return self.request(etiqueta, "DELETE", url, **kwargs)
+
+
+def percentile(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+def summarize(latencias, errores, elapsed):
+    todas = sorted(t for valores in latencias.values() for t in valores)
+
+    def resumen(valores, errores):
+        valores = sorted(valores)
+        return {
+            "peticiones": len(valores),
+            "errores": errores,
+            "rps": len(valores) / elapsed,
+            "p50_ms": percentile(valores, 0.50) * 1000,
+            "p90_ms": percentile(valores, 0.90) * 1000,
+            "p99_ms": percentile(valores, 0.99) * 1000,
+            "max_ms": (valores[-1] if valores else 0.0) * 1000,
+        }
+
+    total = resumen(todas, sum(errores.values()))
+    total["peticiones_por_etiqueta"] = {
+        etiqueta: resumen(valores, errores.get(etiqueta, 0)) for etiqueta, valores in sorted(latencias.items())
+    }
+    return total
+
+
+async def run_scenario(client, nombre, ctx, concurrencia, duracion, seed):
+    scenario = SCENARIOS[nombre]
+    latencias = {}
+    errores = {}
+    deadline = time.perf_counter() + duracion
+
+    async def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        session = Session(client, latencias, errores)
+        while time.perf_counter() < deadline:
+            try:
+                await scenario(session, rng, ctx)
+            except httpx.HTTPError:
+                pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrencia)))
+    return summarize(latencias, errores, time.perf_counter() - start)
+
+
+# ==================== INFORME Y REFERENCIA ====================
+
+def print_report(resultados):
+    print(f"{'escenario':<14} {'etiqueta':<16} {'peticiones':>10} {'req/s':>9} {'p50 ms':>8} "
+          f"{'p90 ms':>8} {'p99 ms':>8} {'errores':>7}")
+    for escenario, r in resultados.items():
+        filas = [("total", r)] + list(r["peticiones_por_etiqueta"].items())
+        for etiqueta, f in filas:
+            print(f"{escenario:<14} {etiqueta:<16} {f['peticiones']:>10} {f['rps']:>9.1f} {f['p50_ms']:>8.2f} "
+                  f"{f['p90_ms']:>8.2f} {f['p99_ms']:>8.2f} {f['errores']:>7}")
+
+
+def compare(resultados, referencia, tolerancia):
+    """Compara con una referencia guardada; devuelve los escenarios que empeoran"""
+    regresiones = []
+    print(f"\nComparación con la referencia (tolerancia {tolerancia:.0%}):")
+    for escenario, actual in resultados.items():
+        base = referencia["resultados"].get(escenario)
+        if base is None:
+            continue
+        rps = actual["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        p99 = actual["p99_ms"] / base["p99_ms"] - 1 if base["p99_ms"] else 0.0
+        peor = rps < -tolerancia or p99 > tolerancia
+        print(f"  {escenario:<14} req/s {rps:+7.1%}   p99 {p99:+7.1%}   {'REGRESIÓN' if peor else 'ok'}")
+        if peor:
+            regresiones.append(escenario)
+    return regresiones
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ==================== PRINCIPAL ====================
+
+async def main_async(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60, trust_env=False,
+                                   limits=httpx.Limits(max_connections=args.concurrencia))
+    else:
+        # La app se importa después de fijar PATHFINDER_DB
+        import pathfinder_api
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=pathfinder_api.app),
+                                   base_url="http://bench", timeout=60)
+
+    ctx = {"personajes": args.personajes}
+    resultados = {}
+    async with client:
+        for nombre in args.escenarios:
+            resultados[nombre] = await run_scenario(client, nombre, ctx, args.concurrencia, args.duracion, args.seed)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--duracion", type=float, default=10, help="segundos por escenario")
+    parser.add_argument("--concurrencia", type=int, default=16, help="usuarios simultáneos")
+    parser.add_argument("--url", help="servidor ya arrancado (por defecto, la app en este proceso)")
+    parser.add_argument("--db", help="base de datos a usar o crear (por defecto, una temporal)")
+    parser.add_argument("--guardar", help="guarda el resultado como JSON de referencia")
+    parser.add_argument("--comparar", help="JSON de referencia con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="empeoramiento admitido (0.2 = 20%%)")
+    datagen.add_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.url:
+        database = args.db or os.path.join(tempfile.mkdtemp(), "loadgen.db")
+        # Antes de importar pathfinder_db, que lee la ruta al cargarse
+        os.environ["PATHFINDER_DB"] = database
+        if not os.path.exists(database):
+            counts = datagen.create_database(database, **datagen.scale(args))
+            print(f"Datos generados: {counts['personajes']} personajes, {counts['inventario']} objetos")
+
+    resultados = asyncio.run(main_async(args))
+    print_report(resultados)
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "commit": _git_commit(),
+                    "python": platform.python_version(),
+                    "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "transporte": args.url or "asgi",
+                    "concurrencia": args.concurrencia,
+                    "duracion": args.duracion,
+                    "escala": datagen.scale(args),
+                },
+                "resultados": resultados,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nReferencia guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            referencia = json.load(f)
+        if compare(resultados, referencia, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
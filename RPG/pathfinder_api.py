@@ -3,24 +3,69 @@ Pathfinder RPG - FastAPI Backend
 Servidor REST API con SQLite
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from contextlib import asynccontextmanager
+from functools import partial
 import sqlite3
-import base64
 import os
 
-app = FastAPI(title="Pathfinder RPG API", version="1.0.0")
-
-# Ruta al archivo HTML
-HTML_FILE = os.path.join(os.path.dirname(__file__), "pathfinder_web_fastapi.html")
-
-@app.get("/", response_class=FileResponse)
-async def serve_frontend():
-    """Sirve el frontend HTML"""
-    return FileResponse(HTML_FILE, media_type="text/html")
+import numpy as np
+
+from pathfinder_cache import etag_matches, library_cache
+from pathfinder_db import (MAX_PAGE_SIZE, campaign_connections, current_campaign, db_executor, db_handler,
+                          is_locked, list_json, pool, run_with_retry, transaction)
+import pathfinder_bulk as bulk
+import pathfinder_campaigns as campaigns
+import pathfinder_dice as dice
+import pathfinder_encounters as encounters
+import pathfinder_events as events
+import pathfinder_json as fastjson
+import pathfinder_loot as loot
+import pathfinder_metrics as metrics
+import pathfinder_migrations as migrations
+import pathfinder_search as fts
+import pathfinder_static as static
+import pathfinder_stats as stats
+from pathfinder_images import SERVED_TYPES, blob_etag, blob_path, store_image, store_images
+from pathfinder_images import shutdown as shutdown_image_pool
+from pathfinder_migrations import EQUIP_SLOTS
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Separar y comprimir el CSS y el JS antes de la primera visita
+    frontend.current()
+    yield
+    # Cerrar las conexiones persistentes al apagar el servidor
+    db_executor.shutdown()
+    pool.close()
+    campaign_connections.close()
+    shutdown_image_pool()
+    encounters.shutdown()
+
+
+app = FastAPI(title="Pathfinder RPG API", version="1.0.0", lifespan=lifespan)
+
+# Frontend HTML con el CSS y el JS servidos aparte
+frontend = static.Frontend()
+
+@app.get("/", response_class=HTMLResponse)
+async def serve_frontend(request: Request):
+    """Sirve el frontend HTML; se revalida con ETag en cada visita"""
+    return static.response(frontend.current(), request, "no-cache")
+
+@app.get(static.STATIC_PREFIX + "{nombre}")
+async def serve_static(nombre: str, request: Request):
+    """CSS y JS del frontend, con el hash del contenido en el nombre"""
+    asset = frontend.asset(nombre)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Recurso no encontrado")
+    return static.response(asset, request, static.IMMUTABLE)
 
 # CORS para permitir conexiones desde el navegador
 app.add_middleware(
@@ -29,149 +74,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-DATABASE = "pathfinder_fastapi.db"
-
-
-def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Latencia, bytes y SQL por ruta para /api/metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
+# /api/campanas/{nombre}/... sobre la base de datos de cada campaña
+app.add_middleware(campaigns.CampaignMiddleware)
 
 def init_db():
-    """Inicializar la base de datos con las tablas necesarias"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Tabla de personajes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS personajes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            clase TEXT DEFAULT 'Guerrero',
-            raza TEXT DEFAULT 'Humano',
-            nivel INTEGER DEFAULT 1,
-            hp_max INTEGER DEFAULT 10,
-            hp_actual INTEGER DEFAULT 10,
-            oro INTEGER DEFAULT 0,
-            fuerza INTEGER DEFAULT 10,
-            destreza INTEGER DEFAULT 10,
-            constitucion INTEGER DEFAULT 10,
-            inteligencia INTEGER DEFAULT 10,
-            sabiduria INTEGER DEFAULT 10,
-            carisma INTEGER DEFAULT 10,
-            notas TEXT DEFAULT '',
-            equip_escudo INTEGER DEFAULT NULL,
-            equip_armadura INTEGER DEFAULT NULL,
-            equip_mano_derecha INTEGER DEFAULT NULL,
-            equip_mano_izquierda INTEGER DEFAULT NULL
-        )
-    ''')
-    
-    # Tabla de inventario
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inventario (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            personaje_id INTEGER,
-            item TEXT NOT NULL,
-            cantidad INTEGER DEFAULT 1,
-            peso REAL DEFAULT 0,
-            descripcion TEXT,
-            valor INTEGER DEFAULT 0,
-            imagen TEXT,
-            FOREIGN KEY (personaje_id) REFERENCES personajes(id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Tabla de habilidades del personaje
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS habilidades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            personaje_id INTEGER,
-            nombre TEXT NOT NULL,
-            atributo TEXT DEFAULT 'inteligencia',
-            rango INTEGER DEFAULT 1,
-            entrenamiento TEXT DEFAULT 'Básico',
-            FOREIGN KEY (personaje_id) REFERENCES personajes(id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Biblioteca de objetos predefinidos
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS objetos_predefinidos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            tipo TEXT DEFAULT 'Misc',
-            peso REAL DEFAULT 0,
-            valor INTEGER DEFAULT 0,
-            descripcion TEXT,
-            imagen TEXT
-        )
-    ''')
-    
-    # Biblioteca de habilidades predefinidas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS habilidades_predefinidas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            clase TEXT,
-            nivel_minimo INTEGER DEFAULT 1,
-            entrenamiento TEXT DEFAULT 'Básico',
-            atributo TEXT DEFAULT 'inteligencia'
-        )
-    ''')
-    
-    # Biblioteca de armaduras predefinidas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS armor_predefinidos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            tipo TEXT DEFAULT 'Ligera',
-            defensa INTEGER DEFAULT 0,
-            peso REAL DEFAULT 0,
-            valor INTEGER DEFAULT 0,
-            descripcion TEXT,
-            imagen TEXT
-        )
-    ''')
-    
-    # Biblioteca de armas predefinidas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS weapons_predefinidos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            tipo TEXT DEFAULT 'Light melee',
-            clase TEXT DEFAULT 'Simple',
-            damage TEXT DEFAULT '1d6',
-            crit_rango INTEGER DEFAULT 20,
-            crit_mult INTEGER DEFAULT 2,
-            peso REAL DEFAULT 0,
-            valor INTEGER DEFAULT 0,
-            descripcion TEXT,
-            imagen TEXT
-        )
-    ''')
-    
-    # Añadir columna clase si no existe (para bases de datos existentes)
-    try:
-        cursor.execute("ALTER TABLE weapons_predefinidos ADD COLUMN clase TEXT DEFAULT 'Simple'")
-    except:
-        pass  # La columna ya existe
-    
-    # Añadir columnas crit_rango y crit_mult si no existen
-    try:
-        cursor.execute("ALTER TABLE weapons_predefinidos ADD COLUMN crit_rango INTEGER DEFAULT 20")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE weapons_predefinidos ADD COLUMN crit_mult INTEGER DEFAULT 2")
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
+    """Inicializar la base de datos aplicando las migraciones pendientes"""
+    with pool.connection() as conn:
+        migrations.migrate(conn)
+    campaigns.migrate_all()
     print("✅ Base de datos inicializada")
 
 
@@ -215,6 +131,11 @@ class PersonajeUpdate(BaseModel):
     equip_mano_izquierda: Optional[int] = None
 
 
+class PersonajePatch(PersonajeUpdate):
+    # Versión leída por el cliente; si no coincide con la actual se responde 409
+    version: Optional[int] = None
+
+
 class InventarioCreate(BaseModel):
     personaje_id: int
     item: str
@@ -269,382 +190,1215 @@ class WeaponCreate(BaseModel):
     tipo: Optional[str] = "Light melee"
     clase: Optional[str] = "Simple"
     damage: Optional[str] = "1d6"
-    crit_rango: Optional[int] = 20
-    crit_mult: Optional[int] = 2
+    crit_rango: Optional[int] = Field(20, ge=2, le=20)
+    crit_mult: Optional[int] = Field(2, ge=2, le=dice.MAX_CRIT_MULT)
     peso: Optional[float] = 0
     valor: Optional[float] = 0
     descripcion: Optional[str] = ""
     imagen: Optional[str] = None
 
 
+# ==================== LISTADOS ====================
+
+# Las bibliotecas se ordenan por nombre; id desempata y completa el cursor
+LIBRARY_ORDER = ("nombre", "id")
+
+
+class ListParams:
+    """Parámetros comunes de los listados: ?after=&limit=&fields=
+
+    Sin `limit` se devuelve la lista completa, como hasta ahora. Si quedan
+    más filas, la cabecera X-Next-Cursor trae el valor para `after`.
+    """
+
+    def __init__(self, after: Optional[str] = None,
+                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                 fields: Optional[str] = None):
+        self.after = after
+        self.limit = limit
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+
+def _list_body(conn, table, order_by, page, filters):
+    """Cuerpo JSON ya codificado del listado y cabeceras (X-Next-Cursor)"""
+    try:
+        body, next_cursor = list_json(conn, table, order_by, page.fields, filters, page.after, page.limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return body, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+
+def _list(conn, table, order_by, page, filters):
+    body, headers = _list_body(conn, table, order_by, page, filters)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _cached_list(request, conn, table, order_by, page, filters):
+    """Listado de biblioteca servido desde la caché en memoria.
+
+    La respuesta se guarda ya serializada; con If-None-Match coincidente se
+    contesta 304 sin cuerpo.
+    """
+    key = (current_campaign.get(), *sorted(request.query_params.multi_items()))
+    # Versión compartida por todos los workers, leída antes que los datos
+    version = conn.execute("SELECT version FROM library_versions WHERE tabla = ?", (table,)).fetchone()[0]
+    entry = library_cache.get(table, key, version)
+    if entry is None:
+        body, headers = _list_body(conn, table, order_by, page, filters)
+        entry = library_cache.put(table, key, version, body, headers)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", **entry.headers}
+    if etag_matches(request.headers.get("if-none-match"), (entry.etag,)):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
 # ==================== ENDPOINTS PERSONAJES ====================
 
 @app.get("/api/personajes")
-def get_personajes():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM personajes ORDER BY id")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_personajes(conn: sqlite3.Connection, clase: Optional[str] = None, page: ListParams = Depends()):
+    return _list(conn, "personajes", ("id",), page, {"clase": clase})
 
 
 @app.get("/api/personajes/{id}")
-def get_personaje(id: int):
-    conn = get_db()
+@db_handler
+def get_personaje(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM personajes WHERE id = ?", (id,))
     row = cursor.fetchone()
-    conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Personaje no encontrado")
-    return dict(row)
+    return fastjson.response(dict(row))
 
 
 @app.post("/api/personajes")
-def create_personaje(personaje: PersonajeCreate):
-    conn = get_db()
+@db_handler
+def create_personaje(conn: sqlite3.Connection, personaje: PersonajeCreate):
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO personajes (nombre, clase, raza, nivel, hp_max, hp_actual, oro,
-                               fuerza, destreza, constitucion, inteligencia, sabiduria, carisma, notas)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (personaje.nombre, personaje.clase, personaje.raza, personaje.nivel,
-          personaje.hp_max, personaje.hp_actual, personaje.oro,
-          personaje.fuerza, personaje.destreza, personaje.constitucion,
-          personaje.inteligencia, personaje.sabiduria, personaje.carisma, personaje.notas))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+    with transaction(conn):
+        cursor.execute('''
+            INSERT INTO personajes (nombre, clase, raza, nivel, hp_max, hp_actual, oro,
+                                   fuerza, destreza, constitucion, inteligencia, sabiduria, carisma, notas)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (personaje.nombre, personaje.clase, personaje.raza, personaje.nivel,
+              personaje.hp_max, personaje.hp_actual, personaje.oro,
+              personaje.fuerza, personaje.destreza, personaje.constitucion,
+              personaje.inteligencia, personaje.sabiduria, personaje.carisma, personaje.notas))
+        new_id = cursor.lastrowid
+        stats.refresh(conn, new_id)
     return {"id": new_id, "message": "Personaje creado"}
 
 
 @app.put("/api/personajes/{id}")
-def update_personaje(id: int, personaje: PersonajeUpdate):
-    conn = get_db()
+@db_handler
+def update_personaje(conn: sqlite3.Connection, id: int, personaje: PersonajeUpdate):
     cursor = conn.cursor()
     
-    # Obtener datos actuales
-    cursor.execute("SELECT * FROM personajes WHERE id = ?", (id,))
-    current = cursor.fetchone()
-    if not current:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Personaje no encontrado")
-    
-    current = dict(current)
-    updates = personaje.dict(exclude_unset=True)
-    
-    for key, value in updates.items():
-        if value is not None:
-            current[key] = value
-    
-    cursor.execute('''
-        UPDATE personajes SET nombre=?, clase=?, raza=?, nivel=?, hp_max=?, hp_actual=?, oro=?,
-                             fuerza=?, destreza=?, constitucion=?, inteligencia=?, sabiduria=?, carisma=?, notas=?
-        WHERE id=?
-    ''', (current['nombre'], current['clase'], current['raza'], current['nivel'],
-          current['hp_max'], current['hp_actual'], current['oro'],
-          current['fuerza'], current['destreza'], current['constitucion'],
-          current['inteligencia'], current['sabiduria'], current['carisma'], current['notas'], id))
-    conn.commit()
-    conn.close()
-    return {"message": "Personaje actualizado"}
+    # Leer y reescribir dentro de la misma transacción para no perder
+    # cambios concurrentes de otro jugador
+    with transaction(conn):
+        cursor.execute("SELECT * FROM personajes WHERE id = ?", (id,))
+        current = cursor.fetchone()
+        if not current:
+            raise HTTPException(status_code=404, detail="Personaje no encontrado")
+        
+        current = dict(current)
+        updates = personaje.dict(exclude_unset=True)
+        cambios = {}
+        
+        for key, value in updates.items():
+            # En las ranuras de equipo, null significa desequipar
+            if value is not None or key.startswith("equip_"):
+                current[key] = value
+                cambios[key] = value
+        
+        cursor.execute('''
+            UPDATE personajes SET nombre=?, clase=?, raza=?, nivel=?, hp_max=?, hp_actual=?, oro=?,
+                                 fuerza=?, destreza=?, constitucion=?, inteligencia=?, sabiduria=?, carisma=?, notas=?,
+                                 equip_escudo=?, equip_armadura=?, equip_mano_derecha=?, equip_mano_izquierda=?,
+                                 version=version + 1
+            WHERE id=?
+            RETURNING version
+        ''', (current['nombre'], current['clase'], current['raza'], current['nivel'],
+              current['hp_max'], current['hp_actual'], current['oro'],
+              current['fuerza'], current['destreza'], current['constitucion'],
+              current['inteligencia'], current['sabiduria'], current['carisma'], current['notas'],
+              current['equip_escudo'], current['equip_armadura'],
+              current['equip_mano_derecha'], current['equip_mano_izquierda'], id))
+        version = cursor.fetchone()["version"]
+        stats.refresh(conn, id)
+    events.broker.publish(id, "personaje", cambios=cambios, version=version)
+    return {"message": "Personaje actualizado", "version": version}
+
+
+@app.patch("/api/personajes/{id}")
+@db_handler
+def patch_personaje(conn: sqlite3.Connection, id: int, personaje: PersonajePatch):
+    """Actualización parcial: un único UPDATE con solo las columnas enviadas.
+
+    Si se envía `version` y otro cliente ya modificó el personaje, no se
+    escribe nada y se responde 409 con la versión actual.
+    """
+    cambios = {key: value for key, value in personaje.dict(exclude_unset=True, exclude={"version"}).items()
+               # En las ranuras de equipo, null significa desequipar
+               if value is not None or key.startswith("equip_")}
+    asignaciones = [f"{key} = ?" for key in cambios] + ["version = version + 1"]
+    sql = f"UPDATE personajes SET {', '.join(asignaciones)} WHERE id = ?"
+    params = [*cambios.values(), id]
+    if personaje.version is not None:
+        sql += " AND version = ?"
+        params.append(personaje.version)
+
+    with transaction(conn):
+        row = conn.execute(sql + " RETURNING version", params).fetchone() if cambios else None
+        if row is None:
+            actual = conn.execute("SELECT version FROM personajes WHERE id = ?", (id,)).fetchone()
+            if actual is None:
+                raise HTTPException(status_code=404, detail="Personaje no encontrado")
+            if personaje.version is not None and personaje.version != actual["version"]:
+                raise HTTPException(status_code=409, detail="El personaje ha cambiado; recarga la ficha",
+                                    headers={"ETag": f'"{actual["version"]}"'})
+            return {"message": "Sin cambios", "version": actual["version"]}
+        # Un tick de puntos de golpe no toca las estadísticas derivadas
+        if not stats.DEPENDENCIAS.isdisjoint(cambios):
+            stats.refresh(conn, id)
+    events.broker.publish(id, "personaje", cambios=cambios, version=row["version"])
+    return {"message": "Personaje actualizado", "version": row["version"]}
 
 
 @app.delete("/api/personajes/{id}")
-def delete_personaje(id: int):
-    conn = get_db()
+@db_handler
+def delete_personaje(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM inventario WHERE personaje_id = ?", (id,))
-    cursor.execute("DELETE FROM habilidades WHERE personaje_id = ?", (id,))
-    cursor.execute("DELETE FROM personajes WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        # ON DELETE CASCADE (foreign_keys=ON) elimina inventario y habilidades
+        cursor.execute("DELETE FROM personajes WHERE id = ?", (id,))
+    if cursor.rowcount:
+        events.broker.publish(id, "eliminado")
     return {"message": "Personaje eliminado"}
 
 
+@app.get("/api/personajes/{id}/stats")
+@db_handler
+def get_personaje_stats(conn: sqlite3.Connection, id: int):
+    """Estadísticas derivadas materializadas (modificadores, habilidades, defensa, carga)"""
+    estadisticas = stats.get(conn, id)
+    if estadisticas is None:
+        raise HTTPException(status_code=404, detail="Personaje no encontrado")
+    return estadisticas
+
+
+@app.get("/api/personajes/{id}/sheet")
+@db_handler
+def get_personaje_sheet(conn: sqlite3.Connection, id: int):
+    """Ficha completa en una sola petición: personaje, inventario, habilidades,
+    equipamiento resuelto y totales de carga"""
+    cursor = conn.cursor()
+    # Transacción de lectura: las tres consultas ven la misma instantánea
+    with transaction(conn, "DEFERRED"):
+        cursor.execute('''
+            SELECT p.*,
+                   COALESCE(t.peso, 0) AS _peso, COALESCE(t.valor, 0) AS _valor, COALESCE(t.objetos, 0) AS _objetos
+            FROM personajes p
+            LEFT JOIN (
+                SELECT personaje_id, SUM(peso * cantidad) AS peso, SUM(valor * cantidad) AS valor,
+                       SUM(cantidad) AS objetos
+                FROM inventario WHERE personaje_id = ? GROUP BY personaje_id
+            ) t ON t.personaje_id = p.id
+            WHERE p.id = ?
+        ''', (id, id))
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Personaje no encontrado")
+        cursor.execute("SELECT * FROM inventario WHERE personaje_id = ? ORDER BY id", (id,))
+        inventario = [dict(r) for r in cursor.fetchall()]
+        cursor.execute("SELECT * FROM habilidades WHERE personaje_id = ? ORDER BY id", (id,))
+        habilidades = [dict(r) for r in cursor.fetchall()]
+
+        estadisticas = stats.get(conn, id)
+
+    personaje = {k: row[k] for k in row.keys() if not k.startswith("_")}
+    por_id = {item["id"]: item for item in inventario}
+    equipo = {slot: por_id.get(personaje.get(f"equip_{slot}")) for slot in EQUIP_SLOTS}
+    return fastjson.response({
+        "personaje": personaje,
+        "inventario": inventario,
+        "habilidades": habilidades,
+        "equipo": equipo,
+        "stats": estadisticas,
+        "totales": {
+            "peso": row["_peso"],
+            "capacidad": (personaje["fuerza"] or 10) * 5,
+            "valor": row["_valor"],
+            "objetos": row["_objetos"],
+            "oro": personaje["oro"] or 0,
+        },
+    })
+
+
+@app.get("/api/personajes/{id}/events")
+async def personaje_events(id: int):
+    """Server-Sent Events con los cambios del personaje (sustituye al polling)"""
+    return StreamingResponse(events.stream(id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # ==================== ENDPOINTS INVENTARIO ====================
 
 @app.get("/api/inventario/{personaje_id}")
-def get_inventario(personaje_id: int):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM inventario WHERE personaje_id = ?", (personaje_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_inventario(conn: sqlite3.Connection, personaje_id: int):
+    body, _ = list_json(conn, "inventario", ("id",), filters={"personaje_id": personaje_id})
+    return Response(body, media_type="application/json")
 
 
 @app.post("/api/inventario")
-def create_inventario(item: InventarioCreate):
-    conn = get_db()
+@db_handler
+def create_inventario(conn: sqlite3.Connection, item: InventarioCreate):
+    imagen = _imagen(item.imagen)
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO inventario (personaje_id, item, cantidad, peso, descripcion, valor, imagen)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (item.personaje_id, item.item, item.cantidad, item.peso, item.descripcion, item.valor, item.imagen))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+    with transaction(conn):
+        try:
+            cursor.execute('''
+                INSERT INTO inventario (personaje_id, item, cantidad, peso, descripcion, valor, imagen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (item.personaje_id, item.item, item.cantidad, item.peso, item.descripcion, item.valor, imagen))
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=404, detail="Personaje no encontrado")
+        new_id = cursor.lastrowid
+        stats.refresh(conn, item.personaje_id)
+    events.broker.publish(item.personaje_id, "inventario", accion="crear", item={
+        "id": new_id, "personaje_id": item.personaje_id, "item": item.item, "cantidad": item.cantidad,
+        "peso": item.peso, "descripcion": item.descripcion, "valor": item.valor, "imagen": imagen})
     return {"id": new_id, "message": "Item agregado al inventario"}
 
 
 @app.put("/api/inventario/{id}")
-def update_inventario(id: int, item: InventarioUpdate):
-    conn = get_db()
+@db_handler
+def update_inventario(conn: sqlite3.Connection, id: int, item: InventarioUpdate):
     cursor = conn.cursor()
     if item.cantidad is not None:
-        cursor.execute("UPDATE inventario SET cantidad = ? WHERE id = ?", (item.cantidad, id))
-    conn.commit()
-    conn.close()
+        with transaction(conn):
+            cursor.execute("SELECT personaje_id FROM inventario WHERE id = ?", (id,))
+            row = cursor.fetchone()
+            cursor.execute("UPDATE inventario SET cantidad = ? WHERE id = ?", (item.cantidad, id))
+            if row:
+                stats.refresh(conn, row["personaje_id"])
+        if row:
+            events.broker.publish(row["personaje_id"], "inventario", accion="actualizar",
+                                  item={"id": id, "cantidad": item.cantidad})
     return {"message": "Inventario actualizado"}
 
 
 @app.delete("/api/inventario/{id}")
-def delete_inventario(id: int):
-    conn = get_db()
+@db_handler
+def delete_inventario(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM inventario WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute("SELECT personaje_id FROM inventario WHERE id = ?", (id,))
+        row = cursor.fetchone()
+        cursor.execute("DELETE FROM inventario WHERE id = ?", (id,))
+        if row:
+            stats.refresh(conn, row["personaje_id"])
+    if row:
+        events.broker.publish(row["personaje_id"], "inventario", accion="eliminar", item={"id": id})
     return {"message": "Item eliminado del inventario"}
 
 
 # ==================== ENDPOINTS HABILIDADES ====================
 
 @app.get("/api/habilidades/{personaje_id}")
-def get_habilidades(personaje_id: int):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM habilidades WHERE personaje_id = ?", (personaje_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_habilidades(conn: sqlite3.Connection, personaje_id: int):
+    body, _ = list_json(conn, "habilidades", ("id",), filters={"personaje_id": personaje_id})
+    return Response(body, media_type="application/json")
 
 
 @app.post("/api/habilidades")
-def create_habilidad(habilidad: HabilidadCreate):
-    conn = get_db()
+@db_handler
+def create_habilidad(conn: sqlite3.Connection, habilidad: HabilidadCreate):
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO habilidades (personaje_id, nombre, atributo, rango, entrenamiento)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (habilidad.personaje_id, habilidad.nombre, habilidad.atributo, habilidad.rango, habilidad.entrenamiento))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+    with transaction(conn):
+        try:
+            cursor.execute('''
+                INSERT INTO habilidades (personaje_id, nombre, atributo, rango, entrenamiento)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (habilidad.personaje_id, habilidad.nombre, habilidad.atributo, habilidad.rango, habilidad.entrenamiento))
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=404, detail="Personaje no encontrado")
+        new_id = cursor.lastrowid
+        stats.refresh(conn, habilidad.personaje_id)
+    events.broker.publish(habilidad.personaje_id, "habilidad", accion="crear", habilidad={
+        "id": new_id, "personaje_id": habilidad.personaje_id, "nombre": habilidad.nombre,
+        "atributo": habilidad.atributo, "rango": habilidad.rango, "entrenamiento": habilidad.entrenamiento})
     return {"id": new_id, "message": "Habilidad agregada"}
 
 
 @app.delete("/api/habilidades/{id}")
-def delete_habilidad(id: int):
-    conn = get_db()
+@db_handler
+def delete_habilidad(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM habilidades WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute("SELECT personaje_id FROM habilidades WHERE id = ?", (id,))
+        row = cursor.fetchone()
+        cursor.execute("DELETE FROM habilidades WHERE id = ?", (id,))
+        if row:
+            stats.refresh(conn, row["personaje_id"])
+    if row:
+        events.broker.publish(row["personaje_id"], "habilidad", accion="eliminar", habilidad={"id": id})
     return {"message": "Habilidad eliminada"}
 
 
+# ==================== OPERACIONES POR LOTES ====================
+
+# Máximo de operaciones por petición de /api/batch
+MAX_BATCH = 500
+
+
+class BatchOperation(BaseModel):
+    op: Literal["personaje.update", "inventario.create", "inventario.update", "inventario.delete",
+                "habilidad.create", "habilidad.delete"]
+    id: Optional[int] = None
+    datos: dict = {}
+
+
+class BatchRequest(BaseModel):
+    operaciones: List[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH)
+
+
+# op -> (handler, modelo de `datos` o None, si necesita `id`)
+BATCH_OPERATIONS = {
+    "personaje.update": (patch_personaje, PersonajePatch, True),
+    "inventario.create": (create_inventario, InventarioCreate, False),
+    "inventario.update": (update_inventario, InventarioUpdate, True),
+    "inventario.delete": (delete_inventario, None, True),
+    "habilidad.create": (create_habilidad, HabilidadCreate, False),
+    "habilidad.delete": (delete_habilidad, None, True),
+}
+
+
+def _batch_operation(conn, operacion):
+    handler, model, con_id = BATCH_OPERATIONS[operacion.op]
+    args = []
+    if con_id:
+        if operacion.id is None:
+            raise HTTPException(status_code=422, detail="Falta el id")
+        args.append(operacion.id)
+    if model is not None:
+        try:
+            args.append(model(**operacion.datos))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    # El cuerpo síncrono del endpoint, con la conexión del lote
+    return handler.__wrapped__(conn, *args)
+
+
+def _batch_images(lote):
+    """Valida los inventario.create y guarda sus imágenes antes de abrir la transacción"""
+    operaciones = []
+    for indice, operacion in enumerate(lote.operaciones):
+        if operacion.op != "inventario.create":
+            continue
+        try:
+            item = InventarioCreate(**operacion.datos)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail={"operacion": indice, "op": operacion.op, "error": str(e)})
+        if item.imagen:
+            operaciones.append((indice, operacion, item.imagen))
+    for (indice, operacion, _), ref in zip(operaciones, store_images([imagen for _, _, imagen in operaciones])):
+        if isinstance(ref, ValueError):
+            raise HTTPException(status_code=400, detail={"operacion": indice, "op": operacion.op, "error": str(ref)})
+        operacion.datos["imagen"] = ref
+
+
+@app.post("/api/batch")
+async def batch(lote: BatchRequest):
+    """Aplica varias escrituras (una ronda de combate) en una sola transacción.
+
+    O se aplican todas o ninguna: si una operación falla se deshace el lote
+    y se responde con el índice de la operación y su error. Los eventos de
+    cada personaje se envían solo tras confirmar.
+    """
+    await run_in_threadpool(_batch_images, lote)
+    return await db_executor.run(_apply_batch, lote)
+
+
+def _apply_batch(conn, lote):
+    resultados = []
+    with events.broker.deferred(), transaction(conn):
+        for indice, operacion in enumerate(lote.operaciones):
+            try:
+                resultado = _batch_operation(conn, operacion)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, headers=e.headers,
+                                    detail={"operacion": indice, "op": operacion.op, "error": e.detail})
+            resultados.append({"op": operacion.op, **resultado})
+    return {"resultados": resultados}
+
+
 # ==================== ENDPOINTS BIBLIOTECA OBJETOS ====================
 
 @app.get("/api/objetos")
-def get_objetos():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM objetos_predefinidos ORDER BY nombre")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_objetos(conn: sqlite3.Connection, request: Request, tipo: Optional[str] = None,
+                page: ListParams = Depends()):
+    return _cached_list(request, conn, "objetos_predefinidos", LIBRARY_ORDER, page, {"tipo": tipo})
 
 
 @app.post("/api/objetos")
-def create_objeto(objeto: ObjetoCreate):
-    conn = get_db()
+@db_handler
+def create_objeto(conn: sqlite3.Connection, objeto: ObjetoCreate):
+    imagen = _imagen(objeto.imagen)
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO objetos_predefinidos (nombre, tipo, peso, valor, descripcion, imagen)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (objeto.nombre, objeto.tipo, objeto.peso, objeto.valor, objeto.descripcion, objeto.imagen))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+    with transaction(conn):
+        cursor.execute('''
+            INSERT INTO main.objetos_predefinidos (nombre, tipo, peso, valor, descripcion, imagen)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (objeto.nombre, objeto.tipo, objeto.peso, objeto.valor, objeto.descripcion, imagen))
+        new_id = cursor.lastrowid
     return {"id": new_id, "message": "Objeto creado"}
 
 
 @app.put("/api/objetos/{id}")
-def update_objeto(id: int, objeto: ObjetoCreate):
-    conn = get_db()
+@db_handler
+def update_objeto(conn: sqlite3.Connection, id: int, objeto: ObjetoCreate):
+    imagen = _imagen(objeto.imagen)
     cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE objetos_predefinidos 
-        SET nombre = ?, tipo = ?, peso = ?, valor = ?, descripcion = ?, imagen = ?
-        WHERE id = ?
-    ''', (objeto.nombre, objeto.tipo, objeto.peso, objeto.valor, objeto.descripcion, objeto.imagen, id))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute('''
+            UPDATE main.objetos_predefinidos 
+            SET nombre = ?, tipo = ?, peso = ?, valor = ?, descripcion = ?, imagen = ?
+            WHERE id = ?
+        ''', (objeto.nombre, objeto.tipo, objeto.peso, objeto.valor, objeto.descripcion, imagen, id))
     return {"message": "Objeto actualizado"}
 
 
 @app.delete("/api/objetos/{id}")
-def delete_objeto(id: int):
-    conn = get_db()
+@db_handler
+def delete_objeto(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM objetos_predefinidos WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute("DELETE FROM main.objetos_predefinidos WHERE id = ?", (id,))
     return {"message": "Objeto eliminado"}
 
 
 # ==================== ENDPOINTS BIBLIOTECA HABILIDADES ====================
 
 @app.get("/api/habilidades-lib")
-def get_habilidades_lib():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM habilidades_predefinidas ORDER BY nombre")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_habilidades_lib(conn: sqlite3.Connection, request: Request, clase: Optional[str] = None,
+                        nivel_minimo: Optional[int] = None, page: ListParams = Depends()):
+    return _cached_list(request, conn, "habilidades_predefinidas", LIBRARY_ORDER, page,
+                        {"clase": clase, "nivel_minimo": nivel_minimo})
 
 
 @app.post("/api/habilidades-lib")
-def create_habilidad_lib(habilidad: HabilidadLibCreate):
-    conn = get_db()
+@db_handler
+def create_habilidad_lib(conn: sqlite3.Connection, habilidad: HabilidadLibCreate):
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO habilidades_predefinidas (nombre, clase, nivel_minimo, entrenamiento, atributo)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (habilidad.nombre, habilidad.clase, habilidad.nivel_minimo, habilidad.entrenamiento, habilidad.atributo))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+    with transaction(conn):
+        cursor.execute('''
+            INSERT INTO main.habilidades_predefinidas (nombre, clase, nivel_minimo, entrenamiento, atributo)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (habilidad.nombre, habilidad.clase, habilidad.nivel_minimo, habilidad.entrenamiento, habilidad.atributo))
+        new_id = cursor.lastrowid
     return {"id": new_id, "message": "Habilidad creada"}
 
 
 @app.delete("/api/habilidades-lib/{id}")
-def delete_habilidad_lib(id: int):
-    conn = get_db()
+@db_handler
+def delete_habilidad_lib(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM habilidades_predefinidas WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute("DELETE FROM main.habilidades_predefinidas WHERE id = ?", (id,))
     return {"message": "Habilidad eliminada"}
 
 
 # ==================== ENDPOINTS BIBLIOTECA ARMOR ====================
 
 @app.get("/api/armor")
-def get_armor():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM armor_predefinidos ORDER BY nombre")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_armor(conn: sqlite3.Connection, request: Request, tipo: Optional[str] = None,
+              page: ListParams = Depends()):
+    return _cached_list(request, conn, "armor_predefinidos", LIBRARY_ORDER, page, {"tipo": tipo})
 
 
 @app.post("/api/armor")
-def create_armor(armor: ArmorCreate):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO armor_predefinidos (nombre, tipo, defensa, peso, valor, descripcion, imagen)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (armor.nombre, armor.tipo, armor.defensa, armor.peso, armor.valor, armor.descripcion, armor.imagen))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+@db_handler
+def create_armor(conn: sqlite3.Connection, armor: ArmorCreate):
+    imagen = _imagen(armor.imagen)
+    with transaction(conn):
+        cursor = conn.execute('''
+            INSERT INTO main.armor_predefinidos (nombre, tipo, defensa, peso, valor, descripcion, imagen)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (armor.nombre, armor.tipo, armor.defensa, armor.peso, armor.valor, armor.descripcion, imagen))
+        new_id = cursor.lastrowid
+        stats.refresh_armor(conn, [armor.nombre])
+    _refresh_campaigns_armor([armor.nombre])
     return {"id": new_id, "message": "Armor creado"}
 
 
 @app.put("/api/armor/{id}")
-def update_armor(id: int, armor: ArmorCreate):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE armor_predefinidos 
-        SET nombre = ?, tipo = ?, defensa = ?, peso = ?, valor = ?, descripcion = ?, imagen = ?
-        WHERE id = ?
-    ''', (armor.nombre, armor.tipo, armor.defensa, armor.peso, armor.valor, armor.descripcion, armor.imagen, id))
-    conn.commit()
-    conn.close()
+@db_handler
+def update_armor(conn: sqlite3.Connection, id: int, armor: ArmorCreate):
+    imagen = _imagen(armor.imagen)
+    with transaction(conn):
+        nombres = [row[0] for row in conn.execute("SELECT nombre FROM main.armor_predefinidos WHERE id = ?", (id,))]
+        conn.execute('''
+            UPDATE main.armor_predefinidos 
+            SET nombre = ?, tipo = ?, defensa = ?, peso = ?, valor = ?, descripcion = ?, imagen = ?
+            WHERE id = ?
+        ''', (armor.nombre, armor.tipo, armor.defensa, armor.peso, armor.valor, armor.descripcion, imagen, id))
+        if nombres:
+            nombres.append(armor.nombre)
+        stats.refresh_armor(conn, nombres)
+    _refresh_campaigns_armor(nombres)
     return {"message": "Armor actualizado"}
 
 
 @app.delete("/api/armor/{id}")
-def delete_armor(id: int):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM armor_predefinidos WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+@db_handler
+def delete_armor(conn: sqlite3.Connection, id: int):
+    with transaction(conn):
+        nombres = [row[0] for row in conn.execute(
+            "DELETE FROM main.armor_predefinidos WHERE id = ? RETURNING nombre", (id,))]
+        stats.refresh_armor(conn, nombres)
+    _refresh_campaigns_armor(nombres)
     return {"message": "Armor eliminado"}
 
 
+def _refresh_armor(conn, nombres):
+    with transaction(conn):
+        stats.refresh_armor(conn, nombres)
+
+
+def _refresh_campaigns_armor(nombres):
+    """La biblioteca principal es el SRD de todas las campañas: tras confirmar
+    un cambio de armaduras en ella se recalculan también sus personajes.
+
+    Cada campaña se reintenta por separado; si sigue bloqueada se avisa y se
+    sigue, porque el cambio del SRD ya está confirmado.
+    """
+    if current_campaign.get() is not None or not nombres:
+        return
+    for name in campaigns.list_campaigns():
+        try:
+            run_with_retry(_refresh_armor, campaign_connections.get(name), nombres)
+        except sqlite3.OperationalError as e:
+            if not is_locked(e):
+                raise
+            print(f"⚠️  Campaña {name}: estadísticas de armaduras sin recalcular ({e})")
+
+
 # ==================== ENDPOINTS BIBLIOTECA WEAPONS ====================
 
 @app.get("/api/weapons")
-def get_weapons():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM weapons_predefinidos ORDER BY nombre")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+@db_handler
+def get_weapons(conn: sqlite3.Connection, request: Request, tipo: Optional[str] = None,
+                clase: Optional[str] = None, page: ListParams = Depends()):
+    return _cached_list(request, conn, "weapons_predefinidos", LIBRARY_ORDER, page, {"tipo": tipo, "clase": clase})
 
 
 @app.post("/api/weapons")
-def create_weapon(weapon: WeaponCreate):
-    conn = get_db()
+@db_handler
+def create_weapon(conn: sqlite3.Connection, weapon: WeaponCreate):
+    imagen = _imagen(weapon.imagen)
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO weapons_predefinidos (nombre, tipo, clase, damage, crit_rango, crit_mult, peso, valor, descripcion, imagen)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (weapon.nombre, weapon.tipo, weapon.clase, weapon.damage, weapon.crit_rango, weapon.crit_mult, weapon.peso, weapon.valor, weapon.descripcion, weapon.imagen))
-    conn.commit()
-    new_id = cursor.lastrowid
-    conn.close()
+    with transaction(conn):
+        cursor.execute('''
+            INSERT INTO main.weapons_predefinidos (nombre, tipo, clase, damage, crit_rango, crit_mult, peso, valor, descripcion, imagen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (weapon.nombre, weapon.tipo, weapon.clase, weapon.damage, weapon.crit_rango, weapon.crit_mult, weapon.peso, weapon.valor, weapon.descripcion, imagen))
+        new_id = cursor.lastrowid
     return {"id": new_id, "message": "Weapon creado"}
 
 
 @app.put("/api/weapons/{id}")
-def update_weapon(id: int, weapon: WeaponCreate):
-    conn = get_db()
+@db_handler
+def update_weapon(conn: sqlite3.Connection, id: int, weapon: WeaponCreate):
+    imagen = _imagen(weapon.imagen)
     cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE weapons_predefinidos 
-        SET nombre = ?, tipo = ?, clase = ?, damage = ?, crit_rango = ?, crit_mult = ?, peso = ?, valor = ?, descripcion = ?, imagen = ?
-        WHERE id = ?
-    ''', (weapon.nombre, weapon.tipo, weapon.clase, weapon.damage, weapon.crit_rango, weapon.crit_mult, weapon.peso, weapon.valor, weapon.descripcion, weapon.imagen, id))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute('''
+            UPDATE main.weapons_predefinidos 
+            SET nombre = ?, tipo = ?, clase = ?, damage = ?, crit_rango = ?, crit_mult = ?, peso = ?, valor = ?, descripcion = ?, imagen = ?
+            WHERE id = ?
+        ''', (weapon.nombre, weapon.tipo, weapon.clase, weapon.damage, weapon.crit_rango, weapon.crit_mult, weapon.peso, weapon.valor, weapon.descripcion, imagen, id))
     return {"message": "Weapon actualizado"}
 
 
 @app.delete("/api/weapons/{id}")
-def delete_weapon(id: int):
-    conn = get_db()
+@db_handler
+def delete_weapon(conn: sqlite3.Connection, id: int):
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM weapons_predefinidos WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with transaction(conn):
+        cursor.execute("DELETE FROM main.weapons_predefinidos WHERE id = ?", (id,))
     return {"message": "Weapon eliminado"}
 
 
+# ==================== IMPORTACIÓN / EXPORTACIÓN MASIVA ====================
+
+BULK_LIBRARIES = {
+    "objetos": ("objetos_predefinidos", ObjetoCreate),
+    "armor": ("armor_predefinidos", ArmorCreate),
+    "weapons": ("weapons_predefinidos", WeaponCreate),
+    "habilidades-lib": ("habilidades_predefinidas", HabilidadLibCreate),
+}
+
+
+def _import_library_batch(conn, lineas, table, model):
+    columns = list(model.model_fields)
+    filas = []
+    errores = []
+    for numero, data in lineas:
+        try:
+            if isinstance(data, ValueError):
+                raise data
+            data = model(**data).dict()
+        except ValueError as e:
+            errores.append({"linea": numero, "error": str(e)})
+            continue
+        filas.append((numero, tuple(data[c] for c in columns)))
+    if table != "armor_predefinidos":
+        insertadas, fallidas = bulk.insert_batch(conn, table, columns, filas)
+        return insertadas, errores + fallidas
+    nombres = [valores[columns.index("nombre")] for _, valores in filas]
+    with transaction(conn):
+        insertadas, fallidas = bulk.insert_batch(conn, table, columns, filas)
+        stats.refresh_armor(conn, nombres)
+    _refresh_campaigns_armor(nombres)
+    return insertadas, errores + fallidas
+
+
+def _import_personajes_batch(conn, lineas):
+    personaje_cols = list(PersonajeCreate.model_fields)
+    inventario_cols = list(InventarioCreate.model_fields)
+    habilidad_cols = list(HabilidadCreate.model_fields)
+    insertadas = 0
+    errores = []
+    with transaction(conn):
+        for numero, data in lineas:
+            # Cada línea en su savepoint: un personaje erróneo no deshace el lote
+            conn.execute("SAVEPOINT linea")
+            try:
+                if isinstance(data, ValueError):
+                    raise data
+                personaje = PersonajeCreate(**data)
+                cursor = conn.execute(
+                    f"INSERT INTO personajes ({', '.join(personaje_cols)}) VALUES ({', '.join('?' * len(personaje_cols))})",
+                    [getattr(personaje, c) for c in personaje_cols])
+                pid = cursor.lastrowid
+                items = [InventarioCreate(**{**i, "personaje_id": pid}) for i in data.get("inventario") or []]
+                conn.executemany(
+                    f"INSERT INTO inventario ({', '.join(inventario_cols)}) VALUES ({', '.join('?' * len(inventario_cols))})",
+                    [[getattr(i, c) for c in inventario_cols] for i in items])
+                skills = [HabilidadCreate(**{**h, "personaje_id": pid}) for h in data.get("habilidades") or []]
+                conn.executemany(
+                    f"INSERT INTO habilidades ({', '.join(habilidad_cols)}) VALUES ({', '.join('?' * len(habilidad_cols))})",
+                    [[getattr(h, c) for c in habilidad_cols] for h in skills])
+                stats.refresh(conn, pid)
+            except (ValueError, TypeError, sqlite3.Error) as e:
+                conn.execute("ROLLBACK TO linea")
+                errores.append({"linea": numero, "error": str(e)})
+            else:
+                insertadas += 1
+            conn.execute("RELEASE linea")
+    return insertadas, errores
+
+
+def _validate_bulk(data, model):
+    """Valida una línea antes de tocar sus imágenes: [objetos con `imagen`].
+
+    Sin `model` la línea es un personaje con su inventario.
+    """
+    try:
+        if model is not None:
+            model(**data)
+            return [data]
+        PersonajeCreate(**data)
+        items = data.get("inventario") or []
+        for item in items:
+            # El personaje_id real se asigna al insertar
+            InventarioCreate(**{**item, "personaje_id": 0})
+        return items
+    except TypeError as e:
+        raise ValueError(str(e))
+
+
+def _prepare_bulk(lote, model):
+    """Analiza y valida las líneas y guarda sus imágenes, fuera de la transacción.
+
+    Las imágenes del lote se decodifican a la vez en el pool. Devuelve
+    (nº de línea, datos) o (nº de línea, ValueError) por línea.
+    """
+    lineas = []
+    con_imagen = []
+    for numero, line in lote:
+        try:
+            data = bulk.parse_line(line)
+            destinos = _validate_bulk(data, model)
+        except ValueError as e:
+            lineas.append((numero, e))
+            continue
+        lineas.append((numero, data))
+        con_imagen.extend((numero, d) for d in destinos if d.get("imagen"))
+    fallidas = {}
+    for (numero, destino), ref in zip(con_imagen, store_images([d["imagen"] for _, d in con_imagen])):
+        if isinstance(ref, ValueError):
+            fallidas[numero] = ref
+        else:
+            destino["imagen"] = ref
+    return [(numero, fallidas.get(numero, data)) for numero, data in lineas]
+
+
+@app.get("/api/bulk/{recurso}")
+async def export_bulk(recurso: str):
+    """Exporta una biblioteca o los personajes como NDJSON en streaming"""
+    if recurso == "personajes":
+        filas = bulk.export_personajes()
+    elif recurso in BULK_LIBRARIES:
+        filas = bulk.export_table(BULK_LIBRARIES[recurso][0], "nombre, id")
+    else:
+        raise HTTPException(status_code=404, detail="Recurso no encontrado")
+    return StreamingResponse(filas, media_type="application/x-ndjson")
+
+
+@app.post("/api/bulk/{recurso}")
+async def import_bulk(recurso: str, request: Request):
+    """Importa NDJSON por lotes; las líneas con error se informan sin abortar"""
+    if recurso == "personajes":
+        importar, model = _import_personajes_batch, None
+    elif recurso in BULK_LIBRARIES:
+        table, model = BULK_LIBRARIES[recurso]
+        importar = partial(_import_library_batch, table=table, model=model)
+    else:
+        raise HTTPException(status_code=404, detail="Recurso no encontrado")
+
+    insertadas = 0
+    errores = []
+    lote = []
+
+    async def importar_lote(lote):
+        # Las imágenes en el threadpool; en el hilo de SQLite solo se inserta
+        lineas = await run_in_threadpool(_prepare_bulk, lote, model)
+        return await db_executor.run(importar, lineas)
+
+    async for numero, line in bulk.iter_lines(request.stream()):
+        lote.append((numero, line))
+        if len(lote) >= bulk.BATCH_SIZE:
+            n, e = await importar_lote(lote)
+            insertadas += n
+            errores += e
+            lote = []
+    if lote:
+        n, e = await importar_lote(lote)
+        insertadas += n
+        errores += e
+
+    errores.sort(key=lambda e: e["linea"])
+    return {"insertadas": insertadas, "errores": errores}
+
+
+# ==================== BÚSQUEDA ====================
+
+@app.get("/api/search")
+@db_handler
+def search(conn: sqlite3.Connection, q: str, tipo: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    """Búsqueda por prefijo en bibliotecas y notas de personajes.
+
+    `tipo` restringe los resultados (objetos, armor, weapons, habilidades-lib,
+    personajes; separados por comas); las facetas cuentan siempre todos.
+    """
+    tipos = {t.strip() for t in tipo.split(",") if t.strip()} if tipo else None
+    if tipos and not tipos <= set(fts.FTS_SOURCES):
+        raise HTTPException(status_code=400, detail=f"Tipo desconocido: {', '.join(sorted(tipos - set(fts.FTS_SOURCES)))}")
+    resultados, facetas = fts.search(conn, q, tipos, limit)
+    return {"resultados": resultados, "facetas": facetas}
+
+
+# ==================== ENDPOINTS DADOS ====================
+
+def _dice(expr):
+    try:
+        return dice.parse(expr)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/dice/roll")
+async def roll_dice(expr: str, veces: int = Query(1, ge=1, le=100), seed: Optional[int] = None):
+    """Tira una expresión de dados (1d20+5, 2d6...) una o varias veces"""
+    parsed = _dice(expr)
+    rng = np.random.default_rng(seed)
+    tiradas = []
+    for _ in range(veces):
+        total, dados = parsed.roll(rng)
+        tiradas.append({"total": total, "dados": dados})
+    return {
+        "expresion": parsed.texto,
+        "minimo": parsed.minimo,
+        "maximo": parsed.maximo,
+        "media": parsed.media,
+        "tiradas": tiradas,
+    }
+
+
+def _load_weapon_and_personaje(conn, weapon_id, personaje_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM weapons_predefinidos WHERE id = ?", (weapon_id,))
+    weapon = cursor.fetchone()
+    if not weapon:
+        raise HTTPException(status_code=404, detail="Weapon no encontrado")
+    cursor.execute("SELECT * FROM personajes WHERE id = ?", (personaje_id,))
+    personaje = cursor.fetchone()
+    if not personaje:
+        raise HTTPException(status_code=404, detail="Personaje no encontrado")
+    return weapon, personaje
+
+
+@app.get("/api/weapons/{id}/simulate")
+async def simulate_weapon(id: int, personaje_id: int, defensa: int = 15,
+                          ensayos: int = Query(10000, ge=1, le=1_000_000),
+                          ataque_base: Optional[int] = None, seed: Optional[int] = None):
+    """Simula ataques del arma con las características del personaje.
+
+    El ataque usa fuerza (cuerpo a cuerpo) o destreza (distancia) más
+    `ataque_base`, que por defecto es el nivel del personaje.
+    """
+    weapon, personaje = await db_executor.run(_load_weapon_and_personaje, id, personaje_id)
+
+    parsed = _dice(weapon["damage"] or "1d6")
+    fuerza = stats.modifier(personaje["fuerza"])
+    if dice.es_distancia(weapon["tipo"]):
+        ataque, bonus_daño = stats.modifier(personaje["destreza"]), 0
+    else:
+        ataque, bonus_daño = fuerza, fuerza
+    if ataque_base is None:
+        ataque_base = personaje["nivel"] or 1
+
+    # La simulación es cálculo puro: al threadpool, sin ocupar un hilo de SQLite
+    try:
+        resultado = await run_in_threadpool(
+            dice.simulate_attacks,
+            np.random.default_rng(seed), parsed, ensayos,
+            ataque=ataque + ataque_base, defensa=defensa, bonus_daño=bonus_daño,
+            crit_rango=weapon["crit_rango"] or 20, crit_mult=weapon["crit_mult"] or 2,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    resultado.update({
+        "arma": weapon["nombre"],
+        "damage": parsed.texto,
+        "ataque": ataque + ataque_base,
+        "bonus_daño": bonus_daño,
+        "defensa": defensa,
+    })
+    return resultado
+
+
+# ==================== SIMULACIÓN DE ENCUENTROS ====================
+
+# Combatientes por bando (contando `cantidad`)
+MAX_COMBATIENTES = 40
+
+
+class CombatienteSim(BaseModel):
+    # Con personaje_id se parte de sus datos guardados; el resto de campos
+    # los sustituyen. Sin él, describe un oponente que no está en la base
+    personaje_id: Optional[int] = None
+    nombre: Optional[str] = Field(None, max_length=100)
+    hp: Optional[int] = Field(None, ge=1, le=encounters.MAX_HP)
+    defensa: Optional[int] = Field(None, ge=-encounters.MAX_MODIFICADOR, le=encounters.MAX_MODIFICADOR)
+    ataque: Optional[int] = Field(None, ge=-encounters.MAX_MODIFICADOR, le=encounters.MAX_MODIFICADOR)
+    damage: Optional[str] = Field(None, max_length=100)
+    bonus_daño: Optional[int] = Field(None, ge=-encounters.MAX_MODIFICADOR, le=encounters.MAX_MODIFICADOR)
+    crit_rango: Optional[int] = Field(None, ge=2, le=20)
+    crit_mult: Optional[int] = Field(None, ge=1, le=dice.MAX_CRIT_MULT)
+    iniciativa: Optional[int] = Field(None, ge=-encounters.MAX_MODIFICADOR, le=encounters.MAX_MODIFICADOR)
+    cantidad: int = Field(1, ge=1, le=MAX_COMBATIENTES)
+
+
+class SimulacionRequest(BaseModel):
+    grupo: List[CombatienteSim] = Field(..., min_length=1, max_length=MAX_COMBATIENTES)
+    oponentes: List[CombatienteSim] = Field(..., min_length=1, max_length=MAX_COMBATIENTES)
+    ensayos: int = Field(10000, ge=1, le=1_000_000)
+    rondas_max: int = Field(50, ge=1, le=500)
+    seed: Optional[int] = Field(None, ge=0)
+
+
+COMBATIENTE_DEFECTO = {"hp": 10, "defensa": stats.DEFENSA_BASE, "ataque": 0, "damage": encounters.DESARMADO,
+                       "bonus_daño": 0, "crit_rango": 20, "crit_mult": 2, "iniciativa": 0}
+
+
+def _load_combatientes(conn, bando):
+    combatientes = []
+    for c in bando:
+        base = dict(COMBATIENTE_DEFECTO, nombre="Oponente")
+        if c.personaje_id is not None:
+            base = encounters.load_personaje(conn, c.personaje_id)
+            if base is None:
+                raise HTTPException(status_code=404, detail=f"Personaje {c.personaje_id} no encontrado")
+        combatiente = {**base, **c.model_dump(exclude={"personaje_id", "cantidad"}, exclude_none=True)}
+        for n in range(c.cantidad):
+            nombre = combatiente["nombre"] if c.cantidad == 1 else f"{combatiente['nombre']} {n + 1}"
+            combatientes.append({**combatiente, "nombre": nombre})
+    if len(combatientes) > MAX_COMBATIENTES:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_COMBATIENTES} combatientes por bando")
+    return combatientes
+
+
+def _load_encuentro(conn, simulacion):
+    return _load_combatientes(conn, simulacion.grupo), _load_combatientes(conn, simulacion.oponentes)
+
+
+@app.post("/api/simulaciones")
+async def simulate_encounter(simulacion: SimulacionRequest):
+    """Simula el encuentro `ensayos` veces entre el grupo y los oponentes.
+
+    Responde en NDJSON: líneas {"progreso", "ensayos"} a medida que acaban
+    los bloques y una última {"resultado"} con la probabilidad de victoria,
+    las rondas y la distribución de HP perdidos de cada combatiente. Con la
+    misma `seed` el resultado se repite; sin ella se devuelve la usada.
+    """
+    grupo, oponentes = await db_executor.run(_load_encuentro, simulacion)
+    try:
+        spec = encounters.build_spec(grupo, oponentes, simulacion.rondas_max)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(encounters.stream(spec, simulacion.ensayos, simulacion.seed),
+                             media_type="application/x-ndjson")
+
+
+# ==================== REPARTO DE BOTÍN ====================
+
+# Líneas de botín y personajes por reparto
+MAX_BOTIN = 500
+MAX_REPARTO_PERSONAJES = 20
+
+
+class BotinItem(BaseModel):
+    biblioteca: Literal["objetos", "armor", "weapons"]
+    id: int
+    cantidad: int = Field(1, ge=1, le=1000)
+
+
+class RepartoRequest(BaseModel):
+    botin: List[BotinItem] = Field(..., min_length=1, max_length=MAX_BOTIN)
+    personajes: List[int] = Field(..., min_length=1, max_length=MAX_REPARTO_PERSONAJES)
+    tiempo_max: float = Field(1.0, gt=0, le=10)
+    # False calcula el reparto sin tocar los inventarios
+    aplicar: bool = True
+
+
+def _load_reparto(conn, reparto):
+    items = loot.load_items(conn, reparto.botin)
+    for pedido, row in items:
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Objeto {pedido.biblioteca}/{pedido.id} no encontrado")
+    personajes = []
+    for personaje_id in dict.fromkeys(reparto.personajes):
+        capacidad = loot.free_capacity(conn, personaje_id)
+        if capacidad is None:
+            raise HTTPException(status_code=404, detail=f"Personaje {personaje_id} no encontrado")
+        personajes.append((personaje_id, *capacidad))
+    return items, personajes
+
+
+def _apply_reparto(conn, asignaciones):
+    with events.broker.deferred(), transaction(conn):
+        try:
+            creadas = loot.apply(conn, asignaciones)
+        except sqlite3.IntegrityError:
+            raise HTTPException(status_code=404, detail="Personaje no encontrado")
+        # Otra escritura puede haber cambiado la carga desde que se calculó
+        for personaje_id in creadas:
+            if stats.get(conn, personaje_id)["carga"]["sobrecargado"]:
+                raise HTTPException(status_code=409, detail="La carga de los personajes ha cambiado; "
+                                                            "vuelve a calcular el reparto")
+        for personaje_id, filas in creadas.items():
+            for item in filas:
+                events.broker.publish(personaje_id, "inventario", accion="crear", item=item)
+    return creadas
+
+
+@app.post("/api/botin/reparto")
+async def reparto_botin(reparto: RepartoRequest):
+    """Reparte el botín maximizando el valor que carga cada personaje.
+
+    Cada personaje puede cargar su capacidad (fuerza x 5) menos el peso que
+    ya lleva. El reparto se busca durante `tiempo_max` segundos como mucho;
+    `optimo` indica si se ha alcanzado la cota superior. Con `aplicar` los
+    objetos se añaden a los inventarios en una sola transacción.
+    """
+    items, personajes = await db_executor.run(_load_reparto, reparto)
+    # La optimización es cálculo puro: al threadpool, sin ocupar un hilo de SQLite
+    resultado = await run_in_threadpool(
+        loot.solve,
+        [(row["peso"] or 0, row["valor"] or 0, pedido.cantidad) for pedido, row in items],
+        [libre for _, _, libre in personajes],
+        reparto.tiempo_max,
+    )
+
+    asignaciones = [(personaje_id, items[idx][1], cantidad)
+                    for (personaje_id, _, _), unidades in zip(personajes, resultado["asignacion"])
+                    for idx, cantidad in sorted(unidades.items())]
+    if reparto.aplicar and asignaciones:
+        await db_executor.run(_apply_reparto, asignaciones)
+
+    def objeto(idx, cantidad):
+        pedido, row = items[idx]
+        return {"biblioteca": pedido.biblioteca, "id": pedido.id, "item": row["nombre"], "cantidad": cantidad,
+                "peso": row["peso"] or 0, "valor": row["valor"] or 0}
+
+    asignadas = [0] * len(items)
+    resumen = []
+    for (personaje_id, nombre, libre), unidades in zip(personajes, resultado["asignacion"]):
+        objetos = [objeto(idx, cantidad) for idx, cantidad in sorted(unidades.items())]
+        for idx, cantidad in unidades.items():
+            asignadas[idx] += cantidad
+        resumen.append({
+            "personaje_id": personaje_id,
+            "nombre": nombre,
+            "capacidad_libre": libre,
+            "peso": sum(o["peso"] * o["cantidad"] for o in objetos),
+            "valor": sum(o["valor"] * o["cantidad"] for o in objetos),
+            "objetos": objetos,
+        })
+    return {
+        "reparto": resumen,
+        "sin_asignar": [objeto(idx, pedido.cantidad - asignadas[idx])
+                        for idx, (pedido, _) in enumerate(items) if asignadas[idx] < pedido.cantidad],
+        "valor_total": resultado["valor"],
+        "cota_superior": resultado["cota_superior"],
+        "optimo": resultado["optimo"],
+        "pasadas": resultado["pasadas"],
+        "aplicado": reparto.aplicar and bool(asignaciones),
+    }
+
+
+# ==================== ENDPOINTS IMÁGENES ====================
+
+def _imagen(value):
+    """Guarda la imagen recibida en el almacén y devuelve su referencia"""
+    try:
+        return store_image(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/imagenes/{nombre}")
+async def get_imagen(nombre: str, request: Request):
+    """Sirve una imagen del almacén con soporte de caché y rangos HTTP"""
+    path = blob_path(nombre)
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+
+    # El nombre es el hash del contenido: la respuesta no caduca nunca
+    headers = {
+        "ETag": blob_etag(nombre),
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+    media_type = SERVED_TYPES.get(nombre.rsplit(".", 1)[-1])
+    if media_type is None:
+        # Blobs anteriores a la lista de tipos admitidos: nunca en línea
+        media_type = "application/octet-stream"
+        headers["Content-Disposition"] = "attachment"
+        headers["Content-Security-Policy"] = "sandbox"
+    if etag_matches(request.headers.get("if-none-match"), (headers["ETag"],)):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+# ==================== MÉTRICAS ====================
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Métricas del proceso en el formato de texto de Prometheus"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/metrics/profile")
+async def get_profile(seconds: float = Query(10, gt=0, le=120)):
+    """Muestrea las pilas de todos los hilos (PATHFINDER_PROFILER=1).
+
+    Devuelve pilas colapsadas para flamegraph.pl o speedscope.
+    """
+    if not metrics.PROFILER:
+        raise HTTPException(status_code=404, detail="Perfilador desactivado (PATHFINDER_PROFILER=1)")
+    stacks = await run_in_threadpool(metrics.sample_stacks, seconds)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="Ya hay un muestreo en curso")
+    return Response(stacks, media_type="text/plain; charset=utf-8")
+
+
+# ==================== CAMPAÑAS ====================
+
+class CampanaCreate(BaseModel):
+    nombre: str
+
+
+@app.get("/api/campanas")
+async def get_campanas():
+    """Campañas disponibles; cada una se usa en /api/campanas/{nombre}/..."""
+    return {"campanas": await run_in_threadpool(campaigns.list_campaigns)}
+
+
+@app.post("/api/campanas", status_code=201)
+async def create_campana(campana: CampanaCreate):
+    try:
+        creada = await run_in_threadpool(campaigns.create, campana.nombre)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not creada:
+        raise HTTPException(status_code=409, detail="La campaña ya existe")
+    return {"nombre": campana.nombre, "url": campaigns.PREFIX + campana.nombre, "message": "Campaña creada"}
+
+
+# ==================== ESTADÍSTICAS DE CACHÉ ====================
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Aciertos, fallos y memoria usada por la caché de bibliotecas"""
+    return library_cache.stats()
+
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/api/health")
-def health_check():
+async def health_check():
     return {"status": "ok", "message": "FastAPI Pathfinder Server Running"}
 
 
-# Inicializar DB al arrancar
-init_db()
+# Inicializar DB al arrancar. Con varios workers lo hace una sola vez el
+# proceso padre antes de lanzarlos (PATHFINDER_SCHEMA_READY). Los procesos
+# de los pools (spawn) importan este módulo como __mp_main__: no migran
+if not os.environ.get("PATHFINDER_SCHEMA_READY") and __name__ != "__mp_main__":
+    init_db()
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
+
+    parser = argparse.ArgumentParser(description="Pathfinder RPG FastAPI Server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PATHFINDER_WORKERS", "1")),
+                        help="procesos uvicorn que atienden peticiones (por defecto 1)")
+    args = parser.parse_args()
+
     print("🎮 Iniciando Pathfinder RPG FastAPI Server...")
-    print("📍 API disponible en: http://localhost:8000")
-    print("📚 Documentación: http://localhost:8000/docs")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    print(f"📍 API disponible en: http://localhost:{args.port}")
+    print(f"📚 Documentación: http://localhost:{args.port}/docs")
+    if args.workers > 1:
+        # El esquema ya está migrado: los workers solo abren conexiones. Las
+        # escrituras de distintos procesos se esperan con busy_timeout y se
+        # reintentan con run_with_retry si aun así encuentran la base bloqueada
+        print(f"👥 {args.workers} workers")
+        os.environ["PATHFINDER_SCHEMA_READY"] = "1"
+        pool.close()
+        uvicorn.run("pathfinder_api:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
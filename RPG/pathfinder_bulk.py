@@ -0,0 +1,134 @@
+"""
+Pathfinder RPG - Importación y exportación masiva en NDJSON
+Una línea JSON por fila. La importación inserta por lotes con executemany
+dentro de transacciones; la exportación va leyendo del cursor sin construir
+la lista completa en memoria.
+"""
+
+import json
+import sqlite3
+
+from pathfinder_db import streaming_connection, table_columns, transaction
+from pathfinder_json import dumps, json_object_sql
+
+# Filas por transacción al importar
+BATCH_SIZE = 500
+
+# Líneas agrupadas en cada fragmento enviado al exportar
+EXPORT_CHUNK = 200
+
+
+async def iter_lines(stream):
+    """Recorre un cuerpo de petición en streaming como (nº de línea, bytes)"""
+    buffer = b""
+    numero = 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            numero += 1
+            if line.strip():
+                yield numero, line
+    if buffer.strip():
+        yield numero + 1, buffer
+
+
+def parse_line(line):
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("cada línea debe ser un objeto JSON")
+    return obj
+
+
+def insert_batch(conn, table, columns, batch):
+    """Inserta un lote de (nº de línea, valores) en una sola transacción.
+
+    Se intenta primero con executemany; si alguna fila falla se deshace el
+    lote y se insertan una a una para informar del error de cada línea sin
+    perder las demás. Devuelve (insertadas, errores).
+    """
+    sql = f"INSERT INTO main.{table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    errores = []
+    with transaction(conn):
+        conn.execute("SAVEPOINT lote")
+        try:
+            conn.executemany(sql, [values for _, values in batch])
+        except sqlite3.Error:
+            conn.execute("ROLLBACK TO lote")
+        else:
+            conn.execute("RELEASE lote")
+            return len(batch), errores
+        conn.execute("RELEASE lote")
+
+        insertadas = 0
+        for numero, values in batch:
+            try:
+                conn.execute(sql, values)
+                insertadas += 1
+            except sqlite3.Error as e:
+                errores.append({"linea": numero, "error": str(e)})
+    return insertadas, errores
+
+
+def export_table(table, order_by="id"):
+    """Generador NDJSON de una tabla completa con su propia conexión.
+
+    Solo exporta las filas del propio fichero: en una campaña las bibliotecas
+    son vistas que añaden las del SRD, que no forman parte de ella.
+    """
+    with streaming_connection() as conn, transaction(conn, "DEFERRED"):
+        # Cada línea sale ya codificada de SQLite
+        cursor = conn.execute(
+            f"SELECT {json_object_sql(table_columns(conn, table))} FROM main.{table} ORDER BY {order_by}")
+        cursor.row_factory = None
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            yield "".join(row[0] + "\n" for row in rows).encode("utf-8")
+
+
+def _group_by_personaje(cursor):
+    """Agrupa un cursor ordenado por personaje_id en tramos (personaje_id, [filas])"""
+    pendiente = None
+    for row in cursor:
+        row = dict(row)
+        if pendiente is not None and pendiente[0] != row["personaje_id"]:
+            yield pendiente
+            pendiente = None
+        if pendiente is None:
+            pendiente = (row["personaje_id"], [])
+        pendiente[1].append(row)
+    if pendiente is not None:
+        yield pendiente
+
+
+def export_personajes():
+    """Una línea por personaje con su inventario y habilidades anidados.
+
+    Las tres tablas se recorren ordenadas por personaje como un merge join,
+    sin una consulta por personaje.
+    """
+    with streaming_connection() as conn, transaction(conn, "DEFERRED"):
+        inventario = _group_by_personaje(conn.execute(
+            "SELECT * FROM inventario WHERE personaje_id IS NOT NULL ORDER BY personaje_id, id"))
+        habilidades = _group_by_personaje(conn.execute(
+            "SELECT * FROM habilidades WHERE personaje_id IS NOT NULL ORDER BY personaje_id, id"))
+        inv = next(inventario, None)
+        hab = next(habilidades, None)
+        lineas = []
+        for row in conn.execute("SELECT * FROM personajes ORDER BY id"):
+            personaje = dict(row)
+            pid = personaje["id"]
+            while inv is not None and inv[0] < pid:
+                inv = next(inventario, None)
+            while hab is not None and hab[0] < pid:
+                hab = next(habilidades, None)
+            personaje["inventario"] = inv[1] if inv is not None and inv[0] == pid else []
+            personaje["habilidades"] = hab[1] if hab is not None and hab[0] == pid else []
+            lineas.append(dumps(personaje) + b"\n")
+            if len(lineas) >= EXPORT_CHUNK:
+                yield b"".join(lineas)
+                lineas = []
+        if lineas:
+            yield b"".join(lineas)
@@ -0,0 +1,102 @@
+"""
+Pathfinder RPG - Caché en memoria de las bibliotecas
+Guarda la respuesta JSON ya serializada de los listados de bibliotecas.
+Cada tabla tiene un contador de versión en library_versions que los
+triggers de SQLite incrementan con cada escritura, venga del worker que
+venga; una entrada de una versión anterior ya no se sirve.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+MAX_BYTES = int(os.environ.get("PATHFINDER_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+
+def etag_matches(if_none_match, etags):
+    """True si If-None-Match incluye alguna de `etags` o es "*".
+
+    Comparación débil: la cabecera es una lista separada por comas y el
+    prefijo W/ no cuenta.
+    """
+    for tag in (if_none_match or "").split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag in etags:
+            return True
+    return False
+
+
+class CacheEntry:
+    __slots__ = ("version", "body", "etag", "headers")
+
+    def __init__(self, version, body, headers):
+        self.version = version
+        self.body = body
+        # ETag por contenido: sigue siendo válido tras reiniciar el servidor
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.headers = headers
+
+
+class LibraryCache:
+    """Caché LRU de respuestas serializadas, acotada en bytes"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, table, key, version):
+        """Entrada de `key` si se calculó con la versión actual de la tabla"""
+        with self._lock:
+            entry = self._entries.get((table, key))
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end((table, key))
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, table, key, version, body, headers=None):
+        """Guarda una respuesta calculada con la versión `version` de la tabla.
+
+        La versión se lee antes de consultar la base de datos: si una
+        escritura llega entre medias, la entrada nace ya caducada.
+        """
+        entry = CacheEntry(version, body, headers or {})
+        size = len(body)
+        if size > self.max_bytes // 4:
+            return entry
+        with self._lock:
+            old = self._entries.pop((table, key), None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[(table, key)] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+library_cache = LibraryCache()
@@ -0,0 +1,92 @@
+"""
+Pathfinder RPG - Campañas
+Una base de datos SQLite por campaña. /api/campanas/{nombre}/... atiende los
+mismos endpoints que /api/..., pero sobre el fichero de esa campaña; la base
+de datos principal sigue sirviendo /api/... y hace de SRD compartido.
+"""
+
+import os
+import tempfile
+
+import pathfinder_json as fastjson
+import pathfinder_migrations as migrations
+from pathfinder_db import CAMPAIGNS_DIR, campaign_path, connect, current_campaign
+
+PREFIX = "/api/campanas/"
+
+
+def list_campaigns():
+    if not os.path.isdir(CAMPAIGNS_DIR):
+        return []
+    return sorted(n[:-3] for n in os.listdir(CAMPAIGNS_DIR) if n.endswith(".db") and campaign_path(n[:-3]))
+
+
+def exists(name):
+    path = campaign_path(name)
+    return path is not None and os.path.isfile(path)
+
+
+def create(name):
+    """Crea la campaña con el esquema al día; False si ya existía"""
+    path = campaign_path(name)
+    if path is None:
+        raise ValueError("Nombre de campaña no válido: minúsculas, números, '-' y '_' (máx. 64)")
+    if os.path.exists(path):
+        return False
+    os.makedirs(CAMPAIGNS_DIR, exist_ok=True)
+    # Se migra en un temporal y se enlaza con su nombre al final: nadie ve
+    # una campaña a medio crear y dos altas simultáneas no se pisan
+    fd, tmp = tempfile.mkstemp(dir=CAMPAIGNS_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        conn = connect(tmp)
+        try:
+            migrations.migrate(conn)
+        finally:
+            conn.close()
+        os.link(tmp, path)
+    except FileExistsError:
+        return False
+    finally:
+        os.unlink(tmp)
+    return True
+
+
+def migrate_all():
+    """Aplica las migraciones pendientes a todas las campañas"""
+    for name in list_campaigns():
+        conn = connect(campaign_path(name))
+        try:
+            if migrations.migrate(conn):
+                print(f"🗺️  Campaña {name} migrada")
+        finally:
+            conn.close()
+
+
+class CampaignMiddleware:
+    """Middleware ASGI: /api/campanas/{nombre}/resto pasa a /api/resto.
+
+    La campaña queda en current_campaign durante la petición; la capa de
+    acceso a datos elige con ella el fichero.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(PREFIX):
+            await self.app(scope, receive, send)
+            return
+        name, sep, rest = scope["path"][len(PREFIX):].partition("/")
+        if not sep:
+            await self.app(scope, receive, send)
+            return
+        if not exists(name):
+            await fastjson.response({"detail": "Campaña no encontrada"}, status_code=404)(scope, receive, send)
+            return
+        path = "/api/" + rest
+        token = current_campaign.set(name)
+        try:
+            await self.app({**scope, "path": path, "raw_path": path.encode()}, receive, send)
+        finally:
+            current_campaign.reset(token)
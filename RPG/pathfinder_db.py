@@ -0,0 +1,549 @@
+"""
+Pathfinder RPG - Capa de acceso a SQLite
+Executor acotado con una conexión por hilo para los handlers async y pool de
+conexiones persistentes para el resto (arranque, exportaciones en streaming)
+"""
+
+import asyncio
+import base64
+import contextvars
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial, wraps
+from urllib.parse import quote
+
+from pathfinder_json import array_body, json_object_sql
+from pathfinder_metrics import SQL_METRICS, TimedConnection
+
+DATABASE = os.environ.get("PATHFINDER_DB", "pathfinder_fastapi.db")
+
+# Tamaño del pool: una conexión por hilo del threadpool que atiende peticiones
+POOL_SIZE = int(os.environ.get("PATHFINDER_POOL_SIZE", "8"))
+
+# Hilos del executor de SQLite; cada uno mantiene su propia conexión
+DB_THREADS = int(os.environ.get("PATHFINDER_DB_THREADS", "8"))
+
+# "executor": handlers async sobre el executor de SQLite (por defecto)
+# "threadpool": handlers síncronos en el threadpool de Starlette, como antes
+DB_MODE = os.environ.get("PATHFINDER_DB_MODE", "executor")
+
+# Sentencias preparadas que cada conexión mantiene en caché
+STATEMENT_CACHE_SIZE = 256
+
+# Con varios procesos escribiendo, "database is locked" puede llegar aunque
+# haya busy_timeout: el handler se repite hasta DB_RETRIES veces con espera
+# exponencial (RETRY_BACKOFF, 2x, 4x... segundos, con variación aleatoria)
+DB_RETRIES = int(os.environ.get("PATHFINDER_DB_RETRIES", "5"))
+RETRY_BACKOFF = float(os.environ.get("PATHFINDER_DB_RETRY_BACKOFF", "0.05"))
+
+# Las transacciones de escritura de este proceso se atienden de una en una:
+# esperan en un cerrojo de Python en lugar de competir por el de SQLite.
+# Solo cubre transaction(): toda escritura de los endpoints va dentro de una
+SINGLE_WRITER = os.environ.get("PATHFINDER_SINGLE_WRITER", "0") == "1"
+_writer_lock = threading.Lock()
+
+# Transacciones de escritura confirmadas por cada hilo: run_with_retry no
+# repite un handler que ya ha confirmado algo
+_commits = threading.local()
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """PRAGMAs aplicados a cada conexión nueva"""
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64 * 1024  # negativo = KiB, positivo = páginas
+    busy_timeout: int = 5000  # ms
+
+
+PROFILES = {
+    # WAL + synchronous=NORMAL: los lectores no esperan a los escritores y
+    # solo se sincroniza a disco en los checkpoints
+    "default": StorageProfile(),
+    # Cada commit llega a disco antes de responder
+    "durable": StorageProfile(synchronous="FULL"),
+    # Para máquinas pequeñas: sin mmap y con caché de páginas reducida
+    "small": StorageProfile(mmap_size=0, cache_size=-8 * 1024),
+    # Comportamiento original de SQLite, útil para comparar; las claves
+    # foráneas siguen activas: los borrados en cascada dependen de ellas
+    "legacy": StorageProfile(journal_mode="DELETE", synchronous="FULL", mmap_size=0,
+                             cache_size=-2000, busy_timeout=0),
+}
+
+STORAGE_PROFILE = PROFILES[os.environ.get("PATHFINDER_STORAGE_PROFILE", "default")]
+
+
+def apply_profile(conn, profile):
+    conn.execute(f"PRAGMA journal_mode = {profile.journal_mode}")
+    conn.execute(f"PRAGMA synchronous = {profile.synchronous}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = {int(profile.cache_size)}")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {int(profile.busy_timeout)}")
+
+
+def connect(database=DATABASE, profile=STORAGE_PROFILE):
+    """Abre una conexión configurada como la usan los endpoints.
+
+    La conexión queda en modo autocommit (isolation_level=None): las
+    escrituras agrupan sus sentencias explícitamente con transaction().
+    """
+    conn = sqlite3.connect(
+        database,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        isolation_level=None,
+        factory=TimedConnection if SQL_METRICS else sqlite3.Connection,
+        uri=True,
+    )
+    conn.row_factory = sqlite3.Row
+    apply_profile(conn, profile)
+    return conn
+
+
+@contextmanager
+def transaction(conn, mode="IMMEDIATE"):
+    """Ejecuta el bloque en una única transacción.
+
+    IMMEDIATE toma el bloqueo de escritura al empezar, de modo que un
+    leer-modificar-escribir no puede perder actualizaciones concurrentes.
+    DEFERRED sirve para lecturas que necesitan una instantánea coherente.
+    Dentro de una transacción ya abierta (POST /api/batch) el bloque se
+    convierte en un savepoint y solo se confirma con la exterior.
+    """
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT anidada")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO anidada")
+            conn.execute("RELEASE anidada")
+            raise
+        else:
+            conn.execute("RELEASE anidada")
+        return
+    writer = SINGLE_WRITER and mode != "DEFERRED"
+    if writer:
+        _writer_lock.acquire()
+    try:
+        conn.execute(f"BEGIN {mode}")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+            if mode != "DEFERRED":
+                _commits.total = getattr(_commits, "total", 0) + 1
+    finally:
+        if writer:
+            _writer_lock.release()
+
+
+def is_locked(error):
+    """True si el error es SQLite ocupada por otra conexión o proceso"""
+    mensaje = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in mensaje or "busy" in mensaje)
+
+
+def run_with_retry(fn, conn, *args, **kwargs):
+    """Ejecuta fn(conn, ...) repitiéndola si la base de datos está bloqueada.
+
+    Solo se repite si fn no ha confirmado ninguna escritura: transaction()
+    ya ha deshecho lo que estuviera a medias, pero lo confirmado se
+    escribiría dos veces. En ese caso el error se propaga.
+    """
+    for intento in range(DB_RETRIES + 1):
+        confirmadas = getattr(_commits, "total", 0)
+        try:
+            return fn(conn, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if intento == DB_RETRIES or not is_locked(e) or getattr(_commits, "total", 0) != confirmadas:
+                raise
+            if conn.in_transaction:
+                conn.rollback()
+            time.sleep(RETRY_BACKOFF * 2 ** intento * random.uniform(0.5, 1.5))
+
+
+class ConnectionPool:
+    """Pool de conexiones SQLite de larga vida.
+
+    Las conexiones se crean bajo demanda hasta `size` y se reutilizan entre
+    peticiones, conservando su caché de páginas y de sentencias preparadas.
+    """
+
+    def __init__(self, database=DATABASE, size=POOL_SIZE, profile=STORAGE_PROFILE):
+        self.database = database
+        self.size = size
+        self.profile = profile
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _new_connection(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return connect(self.database, self.profile)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def acquire(self, timeout=None):
+        if self._closed:
+            raise RuntimeError("El pool de conexiones está cerrado")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        conn = self._new_connection()
+        if conn is not None:
+            return conn
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn):
+        # Una petición que falla a mitad de escritura no debe dejar la
+        # transacción abierta para el siguiente usuario de la conexión
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+pool = ConnectionPool()
+
+
+# ==================== CAMPAÑAS ====================
+# Cada campaña vive en su propio fichero, con su propio bloqueo de escritura.
+# La base de datos principal hace de SRD: sus bibliotecas se adjuntan en
+# solo lectura a cada campaña.
+
+CAMPAIGNS_DIR = os.environ.get("PATHFINDER_CAMPAIGNS",
+                               os.path.join(os.path.dirname(os.path.abspath(DATABASE)), "campanas"))
+SRD_DATABASE = os.environ.get("PATHFINDER_SRD_DB", DATABASE)
+
+# Conexiones a campañas que cada hilo mantiene abiertas (LRU)
+CAMPAIGN_HANDLES = int(os.environ.get("PATHFINDER_CAMPAIGN_HANDLES", "8"))
+
+LIBRARY_TABLES = ("objetos_predefinidos", "armor_predefinidos", "weapons_predefinidos", "habilidades_predefinidas")
+
+_CAMPAIGN_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+# Campaña de la petición en curso (None = base de datos principal)
+current_campaign = contextvars.ContextVar("pathfinder_campaign", default=None)
+
+
+def campaign_path(name):
+    """Fichero de la campaña, o None si el nombre no es válido"""
+    if not _CAMPAIGN_NAME.match(name):
+        return None
+    return os.path.join(CAMPAIGNS_DIR, f"{name}.db")
+
+
+def connect_campaign(name, profile=STORAGE_PROFILE):
+    """Conexión a una campaña con el SRD adjunto como `srd` en solo lectura.
+
+    Vistas temporales con el nombre de cada biblioteca tapan a la tabla en
+    las lecturas: devuelven lo propio de la campaña más el SRD, este con el
+    id en negativo. Las escrituras van explícitamente a main.<tabla>.
+    """
+    conn = connect(campaign_path(name), profile)
+    srd = "file:" + quote(os.path.abspath(SRD_DATABASE)) + "?mode=ro"
+    conn.execute("ATTACH DATABASE ? AS srd", (srd,))
+    for table in LIBRARY_TABLES:
+        columns = table_columns(conn, table)
+        srd_columns = ["-id" if c == "id" else c for c in columns]
+        conn.execute(f"CREATE TEMP VIEW {table} AS SELECT {', '.join(columns)} FROM main.{table} "
+                     f"UNION ALL SELECT {', '.join(srd_columns)} FROM srd.{table}")
+    # La caché de bibliotecas debe caducar tanto si cambia la campaña como el SRD
+    conn.execute("CREATE TEMP VIEW library_versions AS SELECT tabla, sum(version) AS version FROM ("
+                 "SELECT tabla, version FROM main.library_versions "
+                 "UNION ALL SELECT tabla, version FROM srd.library_versions) GROUP BY tabla")
+    return conn
+
+
+class CampaignConnections:
+    """Conexiones a campañas por hilo, en LRU de `capacity` entradas.
+
+    El total de ficheros abiertos queda acotado por hilos × capacity, por
+    muchas campañas que haya.
+    """
+
+    def __init__(self, capacity=CAMPAIGN_HANDLES, profile=STORAGE_PROFILE):
+        self.capacity = capacity
+        self.profile = profile
+        self._local = threading.local()
+        self._open = set()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        lru = getattr(self._local, "lru", None)
+        if lru is None:
+            lru = self._local.lru = OrderedDict()
+        conn = lru.get(name)
+        if conn is not None:
+            lru.move_to_end(name)
+            return conn
+        conn = lru[name] = connect_campaign(name, self.profile)
+        with self._lock:
+            self._open.add(conn)
+        if len(lru) > self.capacity:
+            _, evicted = lru.popitem(last=False)
+            with self._lock:
+                self._open.discard(evicted)
+            evicted.close()
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._open = self._open, set()
+        for conn in connections:
+            conn.close()
+
+
+campaign_connections = CampaignConnections()
+
+
+@contextmanager
+def streaming_connection():
+    """Conexión propia para respuestas en streaming, que pasan de hilo en hilo"""
+    campaign = current_campaign.get()
+    if campaign is None:
+        with pool.connection() as conn:
+            yield conn
+        return
+    conn = connect_campaign(campaign)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+# ==================== LISTADOS PAGINADOS ====================
+
+MAX_PAGE_SIZE = 500
+
+_table_columns = {}
+
+
+def table_columns(conn, table):
+    """Columnas de una tabla, en orden de definición (cacheado por proceso).
+
+    table_xinfo incluye las columnas generadas (hidden 2 y 3), que
+    table_info omite.
+    """
+    if table not in _table_columns:
+        _table_columns[table] = tuple(row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")
+                                      if row[6] != 1)
+    return _table_columns[table]
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor no válido")
+    if not isinstance(values, list):
+        raise ValueError("Cursor no válido")
+    return values
+
+
+def _list_query(conn, table, order_by, fields, filters, after, limit):
+    """SELECT paginado de list_json: (sql sin columnas, params, columnas)"""
+    columns = table_columns(conn, table)
+    if fields:
+        unknown = [f for f in fields if f not in columns]
+        if unknown:
+            raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+        selected = [c for c in columns if c in fields or c in order_by]
+    else:
+        selected = list(columns)
+
+    where = []
+    params = []
+    for column, value in (filters or {}).items():
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if after:
+        values = decode_cursor(after)
+        if len(values) != len(order_by):
+            raise ValueError("Cursor no válido")
+        where.append(f"({', '.join(order_by)}) > ({', '.join('?' * len(order_by))})")
+        params.extend(values)
+
+    sql = f"FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {', '.join(order_by)}"
+    if limit is not None:
+        # Una fila de más indica si hay página siguiente
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return sql, params, selected
+
+
+def list_json(conn, table, order_by, fields=None, filters=None, after=None, limit=None):
+    """Listado con paginación por clave (keyset), proyección y filtros.
+
+    `order_by` debe terminar en una columna única (id) para que el cursor
+    identifique una posición exacta. Las columnas de ordenación se devuelven
+    siempre porque forman el cursor. Devuelve (cuerpo JSON en bytes,
+    siguiente_cursor): SQLite construye el objeto de cada fila; no se crea
+    un dict por fila.
+    """
+    sql, params, selected = _list_query(conn, table, order_by, fields, filters, after, limit)
+    cursor = conn.execute(f"SELECT {json_object_sql(selected)}, {', '.join(order_by)} {sql}", params)
+    cursor.row_factory = None
+    rows = cursor.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1:])
+    return array_body([row[0] for row in rows]), next_cursor
+
+
+# ==================== EXECUTOR ASYNC ====================
+
+class DatabaseExecutor:
+    """Hilos dedicados a SQLite, cada uno con una conexión de larga vida.
+
+    Los handlers async envían aquí su trabajo en lugar de bloquear el event
+    loop; el número de hilos acota las consultas simultáneas.
+    """
+
+    def __init__(self, database=DATABASE, workers=DB_THREADS, profile=STORAGE_PROFILE):
+        self.database = database
+        self.workers = workers
+        self.profile = profile
+        self._local = threading.local()
+        self._executor = None
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _thread_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.database, self.profile)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, fn, args, kwargs):
+        campaign = current_campaign.get()
+        conn = campaign_connections.get(campaign) if campaign else self._thread_connection()
+        try:
+            return run_with_retry(fn, conn, *args, **kwargs)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="sqlite")
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Ejecuta fn(conn, *args, **kwargs) en un hilo del executor.
+
+        El contexto (la petición en curso para las métricas) viaja con la
+        llamada, como hace run_in_threadpool.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_executor(),
+                                          partial(context.run, self._call, fn, args, kwargs))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+db_executor = DatabaseExecutor()
+
+
+def db_handler(func):
+    """Convierte `def handler(conn, ...)` en un endpoint FastAPI.
+
+    En modo "executor" el endpoint es `async def` y el cuerpo se ejecuta en
+    db_executor con la conexión de ese hilo. En modo "threadpool" queda como
+    handler síncrono que toma y devuelve una conexión del pool en su propio
+    hilo: con una dependencia generadora la devolución necesita otro hilo del
+    threadpool y, con más peticiones que conexiones, todos quedan esperando.
+    """
+    sig = inspect.signature(func)
+    params = list(sig.parameters.values())[1:]
+
+    if DB_MODE == "threadpool":
+        @wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            campaign = current_campaign.get()
+            if campaign is None:
+                with pool.connection() as conn:
+                    return run_with_retry(func, conn, *args, **kwargs)
+            conn = campaign_connections.get(campaign)
+            try:
+                return run_with_retry(func, conn, *args, **kwargs)
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+
+        sync_wrapper.__signature__ = sig.replace(parameters=params)
+        return sync_wrapper
+
+    @wraps(func)
+    async def async_wrapper(*args, **kwargs):
+        return await db_executor.run(func, *args, **kwargs)
+
+    async_wrapper.__signature__ = sig.replace(parameters=params)
+    return async_wrapper
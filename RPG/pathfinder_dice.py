@@ -0,0 +1,166 @@
+"""
+Pathfinder RPG - Motor de dados
+Parser de expresiones (1d8+2, 2d6-1, d20...) con caché por cadena y tiradas
+vectorizadas con NumPy para simular miles de ataques a la vez.
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Límites para que una expresión no pueda pedir millones de dados
+MAX_DADOS = 100
+MAX_CARAS = 1000
+
+# Dados por bloque al simular: acota la memoria de cada array de NumPy
+BLOQUE_DADOS = 1_000_000
+
+# Dados en total por simulación: acota la CPU de una petición
+MAX_DADOS_SIMULACION = 50_000_000
+
+# Multiplicador de crítico máximo (x6 ya es excepcional en Pathfinder)
+MAX_CRIT_MULT = 6
+
+_TERMINO = re.compile(r"([+-]?)\s*(?:(\d*)\s*[dD]\s*(\d+)|(\d+))")
+
+
+class DiceExpr:
+    """Expresión de dados ya analizada: suma de grupos NdM y una constante"""
+
+    __slots__ = ("texto", "grupos", "constante")
+
+    def __init__(self, texto, grupos, constante):
+        self.texto = texto
+        self.grupos = grupos  # tuplas (signo, dados, caras)
+        self.constante = constante
+
+    @property
+    def dados(self):
+        return sum(n for _, n, _ in self.grupos)
+
+    @property
+    def minimo(self):
+        return sum(s * (n if s > 0 else n * c) for s, n, c in self.grupos) + self.constante
+
+    @property
+    def maximo(self):
+        return sum(s * (n * c if s > 0 else n) for s, n, c in self.grupos) + self.constante
+
+    @property
+    def media(self):
+        return sum(s * n * (c + 1) / 2 for s, n, c in self.grupos) + self.constante
+
+    def roll(self, rng):
+        """Una tirada: devuelve (total, dados) con el detalle de cada grupo"""
+        dados = []
+        total = self.constante
+        for signo, n, caras in self.grupos:
+            valores = rng.integers(1, caras + 1, size=n).tolist()
+            dados.append({"dados": f"{n}d{caras}", "signo": signo, "valores": valores})
+            total += signo * sum(valores)
+        return total, dados
+
+    def roll_many(self, rng, ensayos, veces=None):
+        """`ensayos` tiradas independientes en un único array de NumPy.
+
+        Con `veces` se hacen esas tiradas por ensayo en la misma llamada y
+        el resultado tiene forma (ensayos, veces).
+        """
+        forma = (ensayos,) if veces is None else (ensayos, veces)
+        total = np.full(forma, self.constante, dtype=np.int64)
+        for signo, n, caras in self.grupos:
+            total += signo * rng.integers(1, caras + 1, size=forma + (n,)).sum(axis=-1)
+        return total
+
+    def __repr__(self):
+        return f"DiceExpr({self.texto!r})"
+
+
+@lru_cache(maxsize=1024)
+def parse(texto):
+    """Analiza una expresión de dados; las repetidas salen de la caché"""
+    limpio = texto.strip()
+    if not limpio:
+        raise ValueError("Expresión de dados vacía")
+    grupos = []
+    constante = 0
+    pos = 0
+    dados = 0
+    while pos < len(limpio):
+        match = _TERMINO.match(limpio, pos)
+        if not match or (pos > 0 and not match.group(1)):
+            raise ValueError(f"Expresión de dados no válida: {texto!r}")
+        signo = -1 if match.group(1) == "-" else 1
+        if match.group(3):
+            n = int(match.group(2) or 1)
+            caras = int(match.group(3))
+            if n < 1 or caras < 1:
+                raise ValueError(f"Expresión de dados no válida: {texto!r}")
+            dados += n
+            if dados > MAX_DADOS or caras > MAX_CARAS:
+                raise ValueError(f"Expresión de dados demasiado grande: {texto!r}")
+            grupos.append((signo, n, caras))
+        else:
+            constante += signo * int(match.group(4))
+        pos = match.end()
+        while pos < len(limpio) and limpio[pos].isspace():
+            pos += 1
+    return DiceExpr(limpio, tuple(grupos), constante)
+
+
+def es_distancia(tipo):
+    """Las armas a distancia usan destreza para atacar y no suman fuerza al daño"""
+    return "ranged" in (tipo or "").lower() or "distancia" in (tipo or "").lower()
+
+
+def simulate_attacks(rng, expr, ensayos, ataque, defensa, bonus_daño, crit_rango, crit_mult):
+    """Simula `ensayos` ataques con las reglas de impacto y crítico de Pathfinder.
+
+    Un 20 natural siempre impacta y un 1 siempre falla. Una amenaza (d20 >=
+    crit_rango que impacta) se confirma con una segunda tirada contra la
+    misma defensa; el crítico tira el daño crit_mult veces. Se simula por
+    bloques de BLOQUE_DADOS dados; lanza ValueError si la simulación entera
+    pasa de MAX_DADOS_SIMULACION.
+    """
+    crit_mult = min(max(crit_mult, 1), MAX_CRIT_MULT)
+    por_ensayo = max(expr.dados, 1) * crit_mult
+    if ensayos * por_ensayo > MAX_DADOS_SIMULACION:
+        raise ValueError(f"Simulación demasiado grande: máximo {MAX_DADOS_SIMULACION // por_ensayo} ensayos "
+                         f"con {expr.texto} x{crit_mult}")
+
+    impactos = criticos = 0
+    suma = suma_cuadrados = 0.0
+    histograma = {}
+    bloque = max(BLOQUE_DADOS // por_ensayo, 1)
+    for inicio in range(0, ensayos, bloque):
+        n = min(bloque, ensayos - inicio)
+        d20 = rng.integers(1, 21, size=n)
+        impacto = (d20 == 20) | ((d20 != 1) & (d20 + ataque >= defensa))
+
+        confirmacion = rng.integers(1, 21, size=n)
+        confirmado = (confirmacion == 20) | ((confirmacion != 1) & (confirmacion + ataque >= defensa))
+        critico = impacto & (d20 >= crit_rango) & confirmado
+
+        # Todas las tiradas del crítico en una llamada; la primera es la normal
+        tiradas = np.maximum(expr.roll_many(rng, n, crit_mult) + bonus_daño, 1)
+        daño = np.where(critico, tiradas.sum(axis=1), np.where(impacto, tiradas[:, 0], 0))
+
+        impactos += int(impacto.sum())
+        criticos += int(critico.sum())
+        suma += float(daño.sum())
+        suma_cuadrados += float(np.square(daño, dtype=np.float64).sum())
+        valores, cuentas = np.unique(daño, return_counts=True)
+        for v, c in zip(valores.tolist(), cuentas.tolist()):
+            histograma[v] = histograma.get(v, 0) + c
+
+    media = suma / ensayos
+    return {
+        "ensayos": ensayos,
+        "prob_impacto": impactos / ensayos,
+        "prob_critico": criticos / ensayos,
+        "daño_esperado": media,
+        "daño_desviacion": max(suma_cuadrados / ensayos - media * media, 0.0) ** 0.5,
+        "daño_esperado_impacto": suma / impactos if impactos else 0.0,
+        "histograma": dict(sorted(histograma.items())),
+    }
@@ -0,0 +1,312 @@
+"""
+Pathfinder RPG - Simulador de encuentros (Monte Carlo)
+Decenas de miles de combates completos entre el grupo y sus oponentes,
+vectorizados con NumPy por bloques de ensayos y repartidos entre un pool de
+procesos. Cada bloque tiene su propia semilla derivada de la de la
+simulación: con la misma semilla el resultado es el mismo sea cual sea el
+número de procesos.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+import pathfinder_dice as dice
+import pathfinder_stats as stats
+from pathfinder_json import dumps
+
+# Procesos que simulan; 0 simula en el threadpool del servidor
+SIM_WORKERS = int(os.environ.get("PATHFINDER_SIM_WORKERS", str(os.cpu_count() or 1)))
+
+# Ensayos por bloque: la unidad de reparto, de semilla y de progreso
+CHUNK_TRIALS = 5000
+
+# Daño sin arma equipada
+DESARMADO = "1d3"
+
+# HP máximos de un combatiente: los contadores de HP perdidos tienen una
+# casilla por punto y ensayo
+MAX_HP = 10_000
+
+# Límite de defensa, ataque, bonificador de daño e iniciativa
+MAX_MODIFICADOR = 1000
+
+GRUPO, OPONENTES = 0, 1
+
+
+# ==================== COMBATIENTES ====================
+
+def _arma_equipada(conn, personaje):
+    """Arma de la biblioteca que corresponde al objeto de la mano derecha"""
+    if personaje["equip_mano_derecha"] is None:
+        return None
+    # El inventario guarda una copia del objeto: el arma se busca por nombre
+    return conn.execute(
+        "SELECT w.nombre, w.tipo, w.damage, w.crit_rango, w.crit_mult FROM inventario i "
+        "JOIN weapons_predefinidos w ON w.nombre = i.item COLLATE NOCASE "
+        "WHERE i.id = ? AND i.personaje_id = ? LIMIT 1",
+        (personaje["equip_mano_derecha"], personaje["id"]),
+    ).fetchone()
+
+
+def load_personaje(conn, personaje_id):
+    """Combatiente con los datos guardados del personaje (None si no existe)"""
+    p = conn.execute("SELECT * FROM personajes WHERE id = ?", (personaje_id,)).fetchone()
+    if p is None:
+        return None
+    weapon = _arma_equipada(conn, p)
+    fuerza = stats.modifier(p["fuerza"])
+    if weapon is not None and dice.es_distancia(weapon["tipo"]):
+        ataque, bonus_daño = stats.modifier(p["destreza"]), 0
+    else:
+        ataque, bonus_daño = fuerza, fuerza
+    return {
+        "nombre": p["nombre"],
+        "hp": p["hp_actual"] if p["hp_actual"] is not None else p["hp_max"],
+        "defensa": stats.get(conn, personaje_id)["defensa"]["total"],
+        "ataque": ataque + (p["nivel"] or 1),
+        "damage": (weapon["damage"] if weapon is not None else None) or DESARMADO,
+        "bonus_daño": bonus_daño,
+        "crit_rango": (weapon["crit_rango"] if weapon is not None else None) or 20,
+        "crit_mult": (weapon["crit_mult"] if weapon is not None else None) or 2,
+        "iniciativa": stats.modifier(p["destreza"]),
+        "arma": weapon["nombre"] if weapon is not None else None,
+    }
+
+
+def build_spec(grupo, oponentes, rondas_max):
+    """Especificación de la simulación a partir de los combatientes de cada bando.
+
+    Solo contiene listas y cadenas: es lo que viaja a los procesos del pool.
+    Lanza ValueError si una expresión de daño no es válida o si los HP de un
+    personaje guardado pasan de MAX_HP.
+    """
+    combatientes = [(GRUPO, c) for c in grupo] + [(OPONENTES, c) for c in oponentes]
+    for _, c in combatientes:
+        dice.parse(c["damage"])
+        if c["hp"] > MAX_HP:
+            raise ValueError(f"{c['nombre']}: máximo {MAX_HP} HP por combatiente")
+    return {
+        "nombres": [c["nombre"] for _, c in combatientes],
+        "bandos": [bando for bando, _ in combatientes],
+        "hp": [max(c["hp"], 1) for _, c in combatientes],
+        "defensa": [c["defensa"] for _, c in combatientes],
+        "ataque": [c["ataque"] for _, c in combatientes],
+        "damage": [c["damage"] for _, c in combatientes],
+        "bonus_daño": [c["bonus_daño"] for _, c in combatientes],
+        "crit_rango": [c["crit_rango"] for _, c in combatientes],
+        "crit_mult": [max(c["crit_mult"], 1) for _, c in combatientes],
+        "iniciativa": [c["iniciativa"] for _, c in combatientes],
+        "rondas_max": rondas_max,
+    }
+
+
+# ==================== SIMULACIÓN ====================
+
+def _impacta(d20, ataque, defensa):
+    # Un 20 natural siempre impacta y un 1 siempre falla
+    return (d20 == 20) | ((d20 != 1) & (d20 + ataque >= defensa))
+
+
+def _daño(rng, spec, exprs, atacante, veces):
+    """Daño de cada ataque: `veces` tiradas del arma del atacante (0 = fallo)"""
+    daño = np.zeros(len(atacante), dtype=np.int64)
+    for j in np.unique(atacante[veces > 0]):
+        filas = np.nonzero((atacante == j) & (veces > 0))[0]
+        n = veces[filas]
+        tiradas = exprs[j].roll_many(rng, len(filas), n.max())
+        tiradas = np.maximum(tiradas + spec["bonus_daño"][j], 1)
+        # Un crítico suma crit_mult tiradas; un impacto normal, solo la primera
+        daño[filas] = np.where(np.arange(n.max()) < n[:, None], tiradas, 0).sum(axis=1)
+    return daño
+
+
+def simulate_chunk(spec, seed, ensayos):
+    """Simula `ensayos` combates completos; devuelve contadores acumulables.
+
+    Cada ronda los combatientes vivos actúan por orden de iniciativa (d20 +
+    destreza, tirada al empezar cada combate) y atacan a un enemigo vivo al
+    azar, con las reglas de impacto y crítico de simulate_attacks. El combate
+    acaba cuando un bando cae entero o tras rondas_max rondas (empate). Se
+    ejecuta en los procesos del pool: recibe y devuelve objetos simples.
+    """
+    rng = np.random.default_rng(seed)
+    exprs = [dice.parse(texto) for texto in spec["damage"]]
+    bandos = np.array(spec["bandos"])
+    hp0 = np.array(spec["hp"], dtype=np.int64)
+    defensa = np.array(spec["defensa"])
+    ataque = np.array(spec["ataque"])
+    crit_rango = np.array(spec["crit_rango"])
+    crit_mult = np.array(spec["crit_mult"])
+    n = len(hp0)
+
+    hp = np.tile(hp0, (ensayos, 1))
+    # Orden de iniciativa de cada combate; el desempate es aleatorio
+    iniciativa = rng.integers(1, 21, size=(ensayos, n)) + np.array(spec["iniciativa"]) + rng.random((ensayos, n))
+    orden = np.argsort(-iniciativa, axis=1)
+    rondas = np.zeros(ensayos, dtype=np.int64)
+    activos = np.arange(ensayos)
+
+    for ronda in range(1, spec["rondas_max"] + 1):
+        if activos.size == 0:
+            break
+        rondas[activos] = ronda
+        # Solo se trabaja con los combates que siguen abiertos
+        sub = hp[activos]
+        filas = np.arange(activos.size)
+        for turno in range(n):
+            atacante = orden[activos, turno]
+            vivos = sub > 0
+            enemigos = vivos & (bandos[None, :] != bandos[atacante][:, None])
+            actua = vivos[filas, atacante] & enemigos.any(axis=1)
+            azar = np.where(enemigos, rng.random(sub.shape), -1.0)
+            objetivo = azar.argmax(axis=1)
+
+            idx = np.nonzero(actua)[0]
+            if idx.size == 0:
+                continue
+            a, t = atacante[idx], objetivo[idx]
+            d20 = rng.integers(1, 21, size=idx.size)
+            impacto = _impacta(d20, ataque[a], defensa[t])
+            confirmado = _impacta(rng.integers(1, 21, size=idx.size), ataque[a], defensa[t])
+            critico = impacto & (d20 >= crit_rango[a]) & confirmado
+            veces = np.where(critico, crit_mult[a], impacto.astype(np.int64))
+            sub[idx, t] -= _daño(rng, spec, exprs, a, veces)
+        hp[activos] = sub
+
+        vivos = sub > 0
+        sigue = (vivos & (bandos == GRUPO)).any(axis=1) & (vivos & (bandos == OPONENTES)).any(axis=1)
+        activos = activos[sigue]
+
+    vivos = hp > 0
+    grupo_vivo = (vivos & (bandos == GRUPO)).any(axis=1)
+    oponentes_vivos = (vivos & (bandos == OPONENTES)).any(axis=1)
+    perdida = hp0 - np.maximum(hp, 0)
+    perdida_grupo = perdida[:, bandos == GRUPO].sum(axis=1)
+    return {
+        "ensayos": ensayos,
+        "victorias": np.array([(grupo_vivo & ~oponentes_vivos).sum(), (oponentes_vivos & ~grupo_vivo).sum(),
+                               (grupo_vivo & oponentes_vivos).sum()]),
+        "rondas": np.bincount(rondas, minlength=spec["rondas_max"] + 1),
+        "caidos": (~vivos).sum(axis=0),
+        "perdida": [np.bincount(perdida[:, j], minlength=hp0[j] + 1) for j in range(n)],
+        "perdida_grupo": np.bincount(perdida_grupo, minlength=hp0[bandos == GRUPO].sum() + 1),
+    }
+
+
+def merge(total, parcial):
+    """Suma los contadores de un bloque a los acumulados"""
+    if total is None:
+        return parcial
+    return {
+        "ensayos": total["ensayos"] + parcial["ensayos"],
+        "victorias": total["victorias"] + parcial["victorias"],
+        "rondas": total["rondas"] + parcial["rondas"],
+        "caidos": total["caidos"] + parcial["caidos"],
+        "perdida": [a + b for a, b in zip(total["perdida"], parcial["perdida"])],
+        "perdida_grupo": total["perdida_grupo"] + parcial["perdida_grupo"],
+    }
+
+
+def _distribucion(histograma):
+    """Media, percentiles e histograma (sin ceros) de una distribución contada"""
+    cuentas = np.asarray(histograma)
+    total = cuentas.sum()
+    valores = np.arange(len(cuentas))
+    acumulado = np.cumsum(cuentas)
+
+    def percentil(p):
+        return int(np.searchsorted(acumulado, p * total))
+
+    return {
+        "media": float((valores * cuentas).sum() / total),
+        "p10": percentil(0.10),
+        "p50": percentil(0.50),
+        "p90": percentil(0.90),
+        "max": int(valores[cuentas > 0].max()),
+        "histograma": {str(v): int(c) for v, c in zip(valores[cuentas > 0], cuentas[cuentas > 0])},
+    }
+
+
+def summarize(spec, total, seed):
+    ensayos = total["ensayos"]
+    grupo, oponentes, empates = (int(v) for v in total["victorias"])
+    return {
+        "ensayos": ensayos,
+        "seed": seed,
+        "victorias": {"grupo": grupo / ensayos, "oponentes": oponentes / ensayos, "empate": empates / ensayos},
+        "rondas": _distribucion(total["rondas"]),
+        "perdida_grupo": _distribucion(total["perdida_grupo"]),
+        "combatientes": [
+            {
+                "nombre": spec["nombres"][j],
+                "bando": "grupo" if spec["bandos"][j] == GRUPO else "oponentes",
+                "hp": spec["hp"][j],
+                "prob_caer": int(total["caidos"][j]) / ensayos,
+                "perdida_hp": _distribucion(total["perdida"][j]),
+            }
+            for j in range(len(spec["hp"]))
+        ],
+    }
+
+
+# ==================== POOL DE PROCESOS ====================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _sim_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(SIM_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def _run_chunk(spec, seed, ensayos):
+    if SIM_WORKERS > 0:
+        try:
+            return await asyncio.wrap_future(_sim_pool().submit(simulate_chunk, spec, seed, ensayos))
+        except BrokenProcessPool:
+            # Un proceso del pool murió: este bloque se simula aquí y el pool
+            # se recrea en la siguiente simulación
+            shutdown()
+    return await run_in_threadpool(simulate_chunk, spec, seed, ensayos)
+
+
+async def stream(spec, ensayos, seed=None):
+    """Simula y emite NDJSON: una línea de progreso por bloque y el resultado.
+
+    Si el cliente se desconecta, los bloques que no han empezado se cancelan.
+    """
+    if seed is None:
+        seed = secrets.randbits(63)
+    tamaños = [min(CHUNK_TRIALS, ensayos - inicio) for inicio in range(0, ensayos, CHUNK_TRIALS)]
+    semillas = np.random.SeedSequence(seed).spawn(len(tamaños))
+    tareas = [asyncio.ensure_future(_run_chunk(spec, s, n)) for s, n in zip(semillas, tamaños)]
+    try:
+        total = None
+        for siguiente in asyncio.as_completed(tareas):
+            total = merge(total, await siguiente)
+            yield dumps({"progreso": total["ensayos"], "ensayos": ensayos}) + b"\n"
+        yield dumps({"resultado": summarize(spec, total, seed)}) + b"\n"
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
@@ -0,0 +1,120 @@
+"""
+Pathfinder RPG - Eventos en tiempo real por personaje
+Canal de Server-Sent Events por personaje_id. Las escrituras publican un
+pequeño diff cuando su transacción ya se ha confirmado; cada navegador
+suscrito lo recibe sin tener que volver a pedir la ficha.
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+from contextlib import contextmanager
+
+from pathfinder_db import current_campaign
+
+# Eventos pendientes por suscriptor antes de considerarlo atascado
+QUEUE_SIZE = 256
+
+# Segundos entre comentarios de keep-alive para que proxies no corten la conexión
+KEEPALIVE = 15
+
+
+class EventBroker:
+    """Reparte eventos entre las colas suscritas a cada personaje.
+
+    publish() puede llamarse desde cualquier hilo (los handlers corren en el
+    executor de la base de datos): la entrega se programa en el bucle de
+    eventos del suscriptor. Sin suscriptores, publicar es una búsqueda en un
+    diccionario.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[channel]
+
+    @contextmanager
+    def deferred(self):
+        """Retiene lo publicado en este hilo hasta que el bloque termina bien.
+
+        Para escrituras agrupadas en una transacción exterior: los eventos
+        solo salen si esa transacción se confirma.
+        """
+        pendientes = self._local.pendientes = []
+        try:
+            yield
+        finally:
+            self._local.pendientes = None
+        for personaje_id, tipo, datos in pendientes:
+            self.publish(personaje_id, tipo, **datos)
+
+    def publish(self, personaje_id, tipo, **datos):
+        pendientes = getattr(self._local, "pendientes", None)
+        if pendientes is not None:
+            pendientes.append((personaje_id, tipo, datos))
+            return
+        with self._lock:
+            subscribers = tuple(self._channels.get(channel(personaje_id), ()))
+        if not subscribers:
+            return
+        event = {"id": next(self._ids), "tipo": tipo, "personaje_id": personaje_id, **datos}
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_deliver, queue, event)
+
+
+def channel(personaje_id):
+    """Canal de un personaje: los ids se repiten entre campañas"""
+    return current_campaign.get(), personaje_id
+
+
+def _deliver(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Un cliente que no lee pierde los diffs: se le pide recargar la ficha
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({"id": event["id"], "tipo": "resync", "personaje_id": event["personaje_id"]})
+
+
+def _format(event):
+    data = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['tipo']}\ndata: {data}\n\n".encode("utf-8")
+
+
+async def stream(personaje_id):
+    """Generador SSE para un personaje; se da de baja al cerrarse la conexión"""
+    key = channel(personaje_id)
+    subscriber = broker.subscribe(key)
+    _, queue = subscriber
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield _format(event)
+    finally:
+        broker.unsubscribe(key, subscriber)
+
+
+broker = EventBroker()
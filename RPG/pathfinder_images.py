@@ -0,0 +1,307 @@
+"""
+Pathfinder RPG - Almacén de imágenes direccionado por contenido
+Las imágenes se guardan una sola vez en disco, con su hash SHA-256 como
+nombre, y las filas solo conservan la URL que las sirve. Al subirlas se
+decodifican una vez, sin metadatos, en tres tamaños WebP (miniatura,
+tarjeta y completa) que se calculan en un pool de procesos.
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import mimetypes
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pathfinder_db import DATABASE
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Opcional: sin Pillow las imágenes se guardan tal cual
+    Image = None
+
+IMAGES_DIR = os.environ.get(
+    "PATHFINDER_IMAGES",
+    os.path.join(os.path.dirname(os.path.abspath(DATABASE)), "imagenes"),
+)
+
+IMAGE_URL_PREFIX = "/api/imagenes/"
+
+# Tablas cuya columna `imagen` puede contener data URLs
+IMAGE_TABLES = ("inventario", "objetos_predefinidos", "armor_predefinidos", "weapons_predefinidos")
+
+_DATA_URL = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?P<params>(;[^,;]*)*?);base64,", re.I)
+_BLOB_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(?:-(?P<variant>thumb|card|full))?\.(?P<ext>[a-z0-9]{1,5})$")
+
+# Variantes de cada imagen subida: (nombre, lado mayor en px). Las listas
+# muestran 60-80 px, así que la miniatura cubre pantallas de densidad 2x.
+# La completa va la última: si existe, las demás ya están escritas.
+VARIANTS = (("thumb", 160), ("card", 480), ("full", 1600))
+WEBP_QUALITY = 80
+
+# Procesos que decodifican y redimensionan; 0 = en el hilo que atiende la petición
+IMAGE_WORKERS = int(os.environ.get("PATHFINDER_IMAGE_WORKERS", str(os.cpu_count() or 1)))
+
+# Tipos admitidos en las subidas y su extensión: solo mapas de bits. Un
+# HTML o un SVG servido desde el mismo origen podría ejecutar scripts
+RASTER_TYPES = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif", "image/webp": "webp"}
+
+# Tipos con los que se sirven los blobs; cualquier otra extensión (blobs
+# antiguos) se descarga como binario y nunca se muestra en línea
+SERVED_TYPES = {ext: mime for mime, ext in RASTER_TYPES.items()}
+
+
+def _extension(mime):
+    return RASTER_TYPES[mime.lower()]
+
+
+def blob_path(name):
+    """Ruta en disco de un blob, o None si el nombre no es válido"""
+    if not _BLOB_NAME.match(name):
+        return None
+    return os.path.join(IMAGES_DIR, name[:2], name)
+
+
+def blob_etag(name):
+    return '"' + name.split(".", 1)[0] + '"'
+
+
+def _write_blob(name, data):
+    path = blob_path(name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escribir en un temporal y renombrar: un lector nunca ve un blob a medias
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def store_bytes(data, mime):
+    """Guarda `data` si no existía ya y devuelve la URL de referencia"""
+    name = f"{hashlib.sha256(data).hexdigest()}.{_extension(mime)}"
+    _write_blob(name, data)
+    return IMAGE_URL_PREFIX + name
+
+
+# ==================== VARIANTES ====================
+
+def render_variants(data):
+    """Decodifica la imagen y devuelve {variante: bytes WebP} sin metadatos.
+
+    Se ejecuta en los procesos del pool: solo recibe y devuelve bytes.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            # Aplicar la orientación EXIF antes de descartar los metadatos
+            img = ImageOps.exif_transpose(original)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+            variants = {}
+            for name, size in VARIANTS:
+                variant = img.copy()
+                variant.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                variant.save(buffer, "WEBP", quality=WEBP_QUALITY)
+                variants[name] = buffer.getvalue()
+            return variants
+    except Image.DecompressionBombError:
+        raise ValueError("Imagen demasiado grande")
+    except (OSError, ValueError):
+        raise ValueError("No se pudo decodificar la imagen")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _image_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def _render_many(datas):
+    """Variantes de varias imágenes; todas se envían al pool a la vez.
+
+    Devuelve, por imagen, el dict de variantes o el ValueError de Pillow.
+    """
+    resultados = [None] * len(datas)
+    if IMAGE_WORKERS > 0:
+        try:
+            futures = [_image_pool().submit(render_variants, data) for data in datas]
+            for i, future in enumerate(futures):
+                try:
+                    resultados[i] = future.result()
+                except ValueError as e:
+                    resultados[i] = e
+            return resultados
+        except BrokenProcessPool:
+            # Un proceso del pool murió: se recrea en la siguiente subida y
+            # lo que falte se decodifica aquí
+            shutdown()
+    for i, data in enumerate(datas):
+        if resultados[i] is None:
+            try:
+                resultados[i] = render_variants(data)
+            except ValueError as e:
+                resultados[i] = e
+    return resultados
+
+
+def ingest(data, use_pool=True):
+    """Guarda las variantes WebP de la imagen; devuelve la URL de la completa.
+
+    El nombre sale del hash de los bytes subidos: subir otra vez la misma
+    imagen no la vuelve a decodificar.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if not os.path.exists(blob_path(f"{digest}-full.webp")):
+        variants = _render_many([data])[0] if use_pool else render_variants(data)
+        if isinstance(variants, ValueError):
+            raise variants
+        _write_variants(digest, variants)
+    return f"{IMAGE_URL_PREFIX}{digest}-full.webp"
+
+
+def _write_variants(digest, variants):
+    for name, body in variants.items():
+        _write_blob(f"{digest}-{name}.webp", body)
+
+
+def _decodable(mime):
+    return Image is not None and bool(mime) and mime.lower() in RASTER_TYPES
+
+
+def _parse_data_url(value):
+    """(bytes, mime) de una data URL de imagen; None si no es una data URL"""
+    match = _DATA_URL.match(value)
+    if not match:
+        return None
+    payload = "".join(value[match.end():].split())
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        data = b""
+    if not data:
+        raise ValueError("Imagen en base64 no válida")
+    mime = (match.group("mime") or "").lower()
+    if mime not in RASTER_TYPES:
+        raise ValueError("Tipo de imagen no admitido: solo PNG, JPEG, GIF o WebP")
+    return data, mime
+
+
+def store_images(values):
+    """store_image de varios valores con las decodificaciones en paralelo.
+
+    Devuelve, por valor, la referencia o el ValueError que lanzaría
+    store_image. Llamar fuera de las transacciones: decodificar tarda.
+    """
+    resultados = [None] * len(values)
+    pendientes = {}  # digest -> (bytes, [índices])
+    for i, value in enumerate(values):
+        try:
+            parsed = _parse_data_url(value) if value else None
+        except ValueError as e:
+            resultados[i] = e
+            continue
+        if parsed is None:
+            resultados[i] = value or None
+        elif not _decodable(parsed[1]):
+            resultados[i] = store_bytes(*parsed)
+        else:
+            digest = hashlib.sha256(parsed[0]).hexdigest()
+            resultados[i] = f"{IMAGE_URL_PREFIX}{digest}-full.webp"
+            if not os.path.exists(blob_path(resultados[i][len(IMAGE_URL_PREFIX):])):
+                pendientes.setdefault(digest, (parsed[0], []))[1].append(i)
+
+    digests = list(pendientes)
+    for digest, variants in zip(digests, _render_many([pendientes[d][0] for d in digests])):
+        if isinstance(variants, ValueError):
+            for i in pendientes[digest][1]:
+                resultados[i] = variants
+        else:
+            _write_variants(digest, variants)
+    return resultados
+
+
+def store_image(value, variants=True):
+    """Convierte el valor recibido en la columna `imagen` en una referencia.
+
+    Las data URLs se decodifican y se guardan en el almacén (con variantes
+    WebP si Pillow está disponible); las referencias ya existentes y las
+    URLs externas se conservan tal cual.
+    """
+    if not variants:
+        if not value:
+            return None
+        parsed = _parse_data_url(value)
+        return value if parsed is None else store_bytes(*parsed)
+    resultado = store_images([value])[0]
+    if isinstance(resultado, ValueError):
+        raise resultado
+    return resultado
+
+
+def migrate_data_urls(conn):
+    """Mueve al almacén las data URLs que aún estén guardadas en las tablas"""
+    migrated = 0
+    for table in IMAGE_TABLES:
+        rows = conn.execute(f"SELECT id, imagen FROM {table} WHERE imagen LIKE 'data:%'").fetchall()
+        for row in rows:
+            try:
+                ref = store_image(row["imagen"], variants=False)
+            except ValueError:
+                continue
+            conn.execute(f"UPDATE {table} SET imagen = ? WHERE id = ?", (ref, row["id"]))
+            migrated += 1
+    return migrated
+
+
+def ingest_stored_images(conn):
+    """Genera las variantes de las imágenes que ya estaban en el almacén.
+
+    Sin pool de procesos: se llama desde las migraciones, dentro de su
+    transacción. Las imágenes que Pillow no puede leer se quedan como están.
+    """
+    if Image is None:
+        return 0
+    ingested = 0
+    for table in IMAGE_TABLES:
+        rows = conn.execute(f"SELECT id, imagen FROM {table} WHERE imagen LIKE ?",
+                            (IMAGE_URL_PREFIX + "%",)).fetchall()
+        for row in rows:
+            name = row["imagen"][len(IMAGE_URL_PREFIX):]
+            match = _BLOB_NAME.match(name)
+            mime = mimetypes.types_map.get("." + match.group("ext")) if match else None
+            if not match or match.group("variant") or not _decodable(mime):
+                continue
+            try:
+                with open(blob_path(name), "rb") as f:
+                    ref = ingest(f.read(), use_pool=False)
+            except (OSError, ValueError):
+                continue
+            conn.execute(f"UPDATE {table} SET imagen = ? WHERE id = ?", (ref, row["id"]))
+            ingested += 1
+    return ingested
@@ -0,0 +1,30 @@
+"""
+Pathfinder RPG - Serialización JSON rápida
+Los listados se devuelven como bytes ya codificados en una Response, sin
+pasar por jsonable_encoder. Las filas de tablas conocidas se codifican en
+SQLite con json_object(): Python solo concatena el texto de cada fila.
+"""
+
+import orjson
+from fastapi.responses import Response
+
+
+def dumps(obj):
+    """Codifica a bytes UTF-8 con orjson"""
+    return orjson.dumps(obj)
+
+
+def response(obj, status_code=200, headers=None):
+    """Response JSON que no recorre el objeto con jsonable_encoder"""
+    return Response(dumps(obj), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def json_object_sql(columns, alias=None):
+    """Expresión SQL que construye el objeto JSON de una fila con esas columnas"""
+    prefix = f"{alias}." if alias else ""
+    return "json_object(" + ", ".join(f"'{c}', {prefix}{c}" for c in columns) + ")"
+
+
+def array_body(textos):
+    """Une los objetos JSON (str) de cada fila en un array JSON"""
+    return ("[" + ",".join(textos) + "]").encode("utf-8")
@@ -0,0 +1,212 @@
+"""
+Pathfinder RPG - Reparto de botín
+Reparte un botín de objetos de las bibliotecas entre varios personajes
+maximizando el valor que cargan sin pasar de su capacidad (fuerza x 5 menos
+lo que ya llevan). Es un problema de mochila múltiple: se resuelve con
+programación dinámica exacta por personaje, probando órdenes de personajes
+hasta agotar el tiempo, y se acota con la mochila de la capacidad conjunta
+y con la de cada personaje por separado; si se alcanza la cota, el reparto
+es óptimo.
+"""
+
+import math
+import random
+import time
+from itertools import permutations
+
+import numpy as np
+
+import pathfinder_stats as stats
+
+# Biblioteca del botín -> tabla
+LOOT_TABLES = {
+    "objetos": "objetos_predefinidos",
+    "armor": "armor_predefinidos",
+    "weapons": "weapons_predefinidos",
+}
+
+# Precisión de los pesos (libras): se redondean hacia arriba al repartir, así
+# que un reparto nunca supera la capacidad real
+RESOLUCION = 0.1
+
+# Celdas máximas de la tabla de la programación dinámica; con botines muy
+# grandes la precisión del peso se reduce para no pasar de aquí
+MAX_CELDAS = 20_000_000
+
+
+# ==================== DATOS ====================
+
+def load_items(conn, pedidos):
+    """Filas de biblioteca del botín: [(pedido, fila)]; None en las que no existen"""
+    items = []
+    for pedido in pedidos:
+        row = conn.execute(
+            f"SELECT id, nombre, peso, valor, descripcion, imagen FROM {LOOT_TABLES[pedido.biblioteca]} WHERE id = ?",
+            (pedido.id,),
+        ).fetchone()
+        items.append((pedido, row))
+    return items
+
+
+def free_capacity(conn, personaje_id):
+    """(nombre, capacidad libre en libras) del personaje; None si no existe"""
+    p = conn.execute("SELECT nombre FROM personajes WHERE id = ?", (personaje_id,)).fetchone()
+    if p is None:
+        return None
+    carga = stats.get(conn, personaje_id)["carga"]
+    return p["nombre"], max(carga["capacidad"] - carga["peso"], 0.0)
+
+
+# ==================== OPTIMIZACIÓN ====================
+
+def _bundles(cantidades):
+    """División binaria de las cantidades (1, 2, 4, ..., resto): mochila 0/1 equivalente"""
+    bundles = []
+    for idx, cantidad in enumerate(cantidades):
+        k = 1
+        while cantidad > 0:
+            n = min(k, cantidad)
+            bundles.append((idx, n))
+            cantidad -= n
+            k *= 2
+    return bundles
+
+
+def _knapsack(pesos, valores, capacidad):
+    """Mochila 0/1 exacta: (valor, índices elegidos). Pesos y capacidad enteros"""
+    dp = np.zeros(capacidad + 1)
+    toma = np.zeros((len(pesos), capacidad + 1), dtype=bool)
+    for i, (w, v) in enumerate(zip(pesos, valores)):
+        if w > capacidad:
+            continue
+        candidato = dp[:capacidad + 1 - w] + v
+        mejora = candidato > dp[w:]
+        toma[i, w:] = mejora
+        dp[w:] = np.where(mejora, candidato, dp[w:])
+    elegidos = []
+    c = capacidad
+    for i in range(len(pesos) - 1, -1, -1):
+        if toma[i, c]:
+            elegidos.append(i)
+            c -= pesos[i]
+    return float(dp[capacidad]), elegidos
+
+
+def _orders(capacidades, rng):
+    """Órdenes de personajes a probar: de menor a mayor capacidad, al revés y
+    después todas las permutaciones (o permutaciones al azar si son muchas)"""
+    k = len(capacidades)
+    ascendente = tuple(sorted(range(k), key=lambda j: capacidades[j]))
+    yield ascendente
+    yield ascendente[::-1]
+    if k <= 6:
+        yield from permutations(range(k))
+    else:
+        while True:
+            yield tuple(rng.sample(range(k), k))
+
+
+def solve(items, capacidades, tiempo_max):
+    """Reparte `items` [(peso, valor, cantidad)] entre personajes con esas capacidades.
+
+    Devuelve {"asignacion": [{item: unidades} por personaje], "valor",
+    "cota_superior", "optimo", "pasadas"}. Al menos una pasada completa se
+    hace siempre; después se prueban otros órdenes hasta `tiempo_max`
+    segundos o hasta alcanzar la cota.
+    """
+    deadline = time.perf_counter() + tiempo_max
+    # Los objetos sin valor no mejoran el reparto
+    utiles = [i for i, (_, valor, cantidad) in enumerate(items) if valor > 0 and cantidad > 0]
+
+    total = sum(capacidades)
+    n_bundles = len(_bundles([items[i][2] for i in utiles]))
+    resolucion = max(RESOLUCION, total * max(n_bundles, 1) / MAX_CELDAS)
+    caps = [math.floor(c / resolucion + 1e-9) for c in capacidades]
+
+    def mochila(restantes, capacidad, redondeo=math.ceil):
+        """Mejor carga de un personaje con las unidades que quedan: (valor, {item: unidades})"""
+        bundles = [(utiles[i], n) for i, n in _bundles([restantes[i] for i in utiles])]
+        # Pesos hacia arriba al repartir (nunca se pasa de la capacidad) y
+        # hacia abajo al acotar (la cota vale para los pesos reales). Las
+        # bibliotecas admiten pesos negativos: cuentan como 0
+        margen = -1e-9 if redondeo is math.ceil else 1e-9
+        valor, elegidos = _knapsack([max(0, redondeo(items[idx][0] * n / resolucion + margen)) for idx, n in bundles],
+                                    [items[idx][1] * n for idx, n in bundles], capacidad)
+        unidades = {}
+        for b in elegidos:
+            idx, n = bundles[b]
+            unidades[idx] = unidades.get(idx, 0) + n
+        return valor, unidades
+
+    # Cota: la mejor mochila con la capacidad de todos juntos, o la suma de
+    # lo que cargaría cada personaje si tuviera el botín entero para él
+    cantidades = [cantidad for _, _, cantidad in items]
+    cota = min(mochila(cantidades, math.floor(total / resolucion + 1e-9), math.floor)[0],
+               sum(mochila(cantidades, cap, math.floor)[0] for cap in caps))
+
+    # Cada pasada llena los personajes de uno en uno, cada uno de forma
+    # óptima con lo que dejan los anteriores; el orden cambia el resultado
+    mejor, mejor_valor, pasadas = None, -1.0, 0
+    rng = random.Random(0)
+    vistos = set()
+    for orden in _orders(caps, rng):
+        if orden in vistos:
+            if len(vistos) >= math.factorial(len(caps)):
+                break
+            continue
+        vistos.add(orden)
+        restantes = list(cantidades)
+        asignacion = [{} for _ in caps]
+        valores = [0.0] * len(caps)
+        for j in orden:
+            valores[j], asignacion[j] = mochila(restantes, caps[j])
+            for idx, n in asignacion[j].items():
+                restantes[idx] -= n
+        # Mejora local: cada personaje vuelve a elegir entre lo suyo y lo que
+        # ha sobrado, con los demás fijos, mientras alguno mejore
+        mejora = True
+        while mejora and time.perf_counter() < deadline:
+            mejora = False
+            for j in orden:
+                for idx, n in asignacion[j].items():
+                    restantes[idx] += n
+                v, unidades = mochila(restantes, caps[j])
+                if v > valores[j] + 1e-9:
+                    valores[j], asignacion[j], mejora = v, unidades, True
+                for idx, n in asignacion[j].items():
+                    restantes[idx] -= n
+        valor = sum(valores)
+        pasadas += 1
+        if valor > mejor_valor:
+            mejor, mejor_valor = asignacion, valor
+        if mejor_valor >= cota - 1e-9 or time.perf_counter() >= deadline:
+            break
+
+    return {
+        "asignacion": mejor,
+        "valor": mejor_valor,
+        "cota_superior": cota,
+        "optimo": mejor_valor >= cota - 1e-9,
+        "pasadas": pasadas,
+    }
+
+
+# ==================== APLICACIÓN ====================
+
+def apply(conn, asignaciones):
+    """Inserta el reparto en el inventario: [(personaje_id, fila, cantidad)].
+
+    Llamar dentro de una transacción; devuelve las filas creadas por
+    personaje para publicar los eventos tras confirmar.
+    """
+    creadas = {}
+    for personaje_id, row, cantidad in asignaciones:
+        item = {"personaje_id": personaje_id, "item": row["nombre"], "cantidad": cantidad, "peso": row["peso"],
+                "descripcion": row["descripcion"], "valor": row["valor"], "imagen": row["imagen"]}
+        cursor = conn.execute(
+            "INSERT INTO inventario (personaje_id, item, cantidad, peso, descripcion, valor, imagen) "
+            "VALUES (:personaje_id, :item, :cantidad, :peso, :descripcion, :valor, :imagen)", item)
+        creadas.setdefault(personaje_id, []).append({"id": cursor.lastrowid, **item})
+    for personaje_id in creadas:
+        stats.refresh(conn, personaje_id)
+    return creadas
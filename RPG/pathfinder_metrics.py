@@ -0,0 +1,318 @@
+"""
+Pathfinder RPG - Métricas e instrumentación
+Latencia y bytes de respuesta por ruta (middleware ASGI), número y duración
+de las sentencias SQL (medidas en la propia conexión), registro opcional de
+consultas lentas y un perfilador por muestreo. /api/metrics lo expone en el
+formato de texto de Prometheus; con varios workers cada proceso lleva sus
+propias métricas.
+"""
+
+import contextvars
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+
+# Medir cada sentencia SQL cuesta unos microsegundos; "0" lo desactiva
+SQL_METRICS = os.environ.get("PATHFINDER_SQL_METRICS", "1") == "1"
+
+# Sentencias más lentas que esto (ms) se registran con su texto; 0 = desactivado
+SLOW_QUERY_MS = float(os.environ.get("PATHFINDER_SLOW_QUERY_MS", "0"))
+
+# Habilita el perfilador por muestreo en /api/metrics/profile
+PROFILER = os.environ.get("PATHFINDER_PROFILER", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+logger = logging.getLogger("pathfinder.sql")
+
+
+# ==================== TIPOS DE MÉTRICA ====================
+
+def _labels(names, values, extra=""):
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Histograma con etiquetas y buckets acumulativos, como los de Prometheus"""
+
+    def __init__(self, name, description, labelnames, buckets):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                # Una cuenta por bucket, +Inf y la suma de los valores
+                serie = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[i] += 1
+            serie[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(serie)) for labels, serie in self._series.items())
+        for labels, serie in series:
+            acumulado = 0
+            for le, n in zip(self.buckets + ("+Inf",), serie[:-1]):
+                acumulado += n
+                bucket = _labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket} {acumulado}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {serie[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {acumulado}")
+        return lines
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    def __init__(self, name, description, labelnames):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in values)
+        return lines
+
+
+REQUEST_DURATION = Histogram("pathfinder_http_request_duration_seconds",
+                             "Latencia de las peticiones por ruta", ("method", "route", "status"), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram("pathfinder_http_response_bytes",
+                          "Bytes del cuerpo de la respuesta por ruta", ("method", "route"), SIZE_BUCKETS)
+REQUEST_SQL_STATEMENTS = Counter("pathfinder_http_sql_statements_total",
+                                 "Sentencias SQL ejecutadas por las peticiones de cada ruta", ("method", "route"))
+REQUEST_SQL_SECONDS = Counter("pathfinder_http_sql_seconds_total",
+                              "Segundos en SQLite (ejecución y lectura de filas) por ruta", ("method", "route"))
+SQL_DURATION = Histogram("pathfinder_sql_statement_duration_seconds",
+                         "Duración de cada sentencia SQL por tipo", ("kind",), SQL_BUCKETS)
+SLOW_QUERIES = Counter("pathfinder_sql_slow_queries_total",
+                       "Sentencias por encima de PATHFINDER_SLOW_QUERY_MS", ("kind",))
+
+METRICS = (REQUEST_DURATION, RESPONSE_SIZE, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS, SQL_DURATION, SLOW_QUERIES)
+
+
+def render():
+    """Todas las métricas en el formato de texto de Prometheus"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# ==================== SQL ====================
+
+class RequestStats:
+    """SQL acumulado por la petición en curso"""
+    __slots__ = ("path", "statements", "sql_seconds")
+
+    def __init__(self, path):
+        self.path = path
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+# Petición en curso; DatabaseExecutor copia el contexto al hilo de SQLite
+current_request = contextvars.ContextVar("pathfinder_request", default=None)
+
+
+def _kind(sql):
+    partes = sql.split(None, 1)
+    return partes[0].upper() if partes else "?"
+
+
+def record_sql(sql, elapsed):
+    kind = _kind(sql)
+    SQL_DURATION.observe(elapsed, kind)
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(1, kind)
+        logger.warning("Consulta lenta (%.1f ms) en %s: %s", elapsed * 1000,
+                       stats.path if stats is not None else "-", " ".join(sql.split())[:500])
+
+
+def _record_fetch(elapsed):
+    stats = current_request.get()
+    if stats is not None:
+        stats.sql_seconds += elapsed
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que mide cada sentencia.
+
+    execute() devuelve al tener la primera fila; el tiempo de fetch*() se
+    suma al de la petición. Recorrer el cursor con `for` no se mide.
+    """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_fetch(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _record_fetch(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_fetch(time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Conexión cuyas sentencias, commits y rollbacks pasan por TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            record_sql("COMMIT", time.perf_counter() - start)
+
+    def rollback(self):
+        start = time.perf_counter()
+        try:
+            super().rollback()
+        finally:
+            record_sql("ROLLBACK", time.perf_counter() - start)
+
+
+# ==================== MIDDLEWARE ====================
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia, estado, bytes y SQL de cada petición HTTP.
+
+    La ruta se etiqueta con su plantilla (/api/personajes/{id}), no con la
+    URL, para que el número de series no crezca con los ids.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["path"])
+        token = current_request.set(stats)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", "sin_ruta")
+            method = scope["method"]
+            REQUEST_DURATION.observe(elapsed, method, route, str(status))
+            RESPONSE_SIZE.observe(size, method, route)
+            REQUEST_SQL_STATEMENTS.inc(stats.statements, method, route)
+            REQUEST_SQL_SECONDS.inc(stats.sql_seconds, method, route)
+
+
+# ==================== PERFILADOR ====================
+
+_profiling = threading.Lock()
+
+
+def sample_stacks(seconds, interval=0.005):
+    """Muestrea las pilas de todos los hilos durante `seconds` segundos.
+
+    Devuelve las pilas en formato "colapsado" (hilo;función;...;función N),
+    el que leen flamegraph.pl y speedscope. Solo un muestreo a la vez:
+    devuelve None si ya hay otro en curso.
+    """
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        counts = StackCounter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+    finally:
+        _profiling.release()
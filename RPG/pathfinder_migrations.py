@@ -0,0 +1,279 @@
+"""
+Pathfinder RPG - Migraciones del esquema
+Migraciones numeradas que se aplican una sola vez, cada una en su propia
+transacción, registrando la versión en PRAGMA user_version. Con el esquema
+al día, el arranque es una única lectura de esa versión.
+"""
+
+import pathfinder_search as fts
+import pathfinder_stats as stats
+from pathfinder_db import LIBRARY_TABLES, transaction
+from pathfinder_images import IMAGE_TABLES, ingest_stored_images, migrate_data_urls
+
+EQUIP_SLOTS = ("escudo", "armadura", "mano_derecha", "mano_izquierda")
+
+LIBRARY_INDEXES = (
+    ("personajes", ("clase", "id")),
+    ("objetos_predefinidos", ("nombre", "id")),
+    ("objetos_predefinidos", ("tipo", "nombre", "id")),
+    ("armor_predefinidos", ("nombre", "id")),
+    ("armor_predefinidos", ("tipo", "nombre", "id")),
+    ("weapons_predefinidos", ("nombre", "id")),
+    ("weapons_predefinidos", ("tipo", "nombre", "id")),
+    ("weapons_predefinidos", ("clase", "nombre", "id")),
+    ("habilidades_predefinidas", ("nombre", "id")),
+    ("habilidades_predefinidas", ("clase", "nombre", "id")),
+    ("habilidades_predefinidas", ("nivel_minimo", "nombre", "id")),
+)
+
+# Columnas añadidas después de la primera versión de cada tabla
+ADDED_COLUMNS = (
+    *(("personajes", f"equip_{slot}", "INTEGER DEFAULT NULL") for slot in EQUIP_SLOTS),
+    ("personajes", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("weapons_predefinidos", "clase", "TEXT DEFAULT 'Simple'"),
+    ("weapons_predefinidos", "crit_rango", "INTEGER DEFAULT 20"),
+    ("weapons_predefinidos", "crit_mult", "INTEGER DEFAULT 2"),
+)
+
+
+def _create_tables(conn):
+    # Tabla de personajes
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS personajes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            clase TEXT DEFAULT 'Guerrero',
+            raza TEXT DEFAULT 'Humano',
+            nivel INTEGER DEFAULT 1,
+            hp_max INTEGER DEFAULT 10,
+            hp_actual INTEGER DEFAULT 10,
+            oro INTEGER DEFAULT 0,
+            fuerza INTEGER DEFAULT 10,
+            destreza INTEGER DEFAULT 10,
+            constitucion INTEGER DEFAULT 10,
+            inteligencia INTEGER DEFAULT 10,
+            sabiduria INTEGER DEFAULT 10,
+            carisma INTEGER DEFAULT 10,
+            notas TEXT DEFAULT '',
+            equip_escudo INTEGER DEFAULT NULL,
+            equip_armadura INTEGER DEFAULT NULL,
+            equip_mano_derecha INTEGER DEFAULT NULL,
+            equip_mano_izquierda INTEGER DEFAULT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Tabla de inventario
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            personaje_id INTEGER,
+            item TEXT NOT NULL,
+            cantidad INTEGER DEFAULT 1,
+            peso REAL DEFAULT 0,
+            descripcion TEXT,
+            valor INTEGER DEFAULT 0,
+            imagen TEXT,
+            FOREIGN KEY (personaje_id) REFERENCES personajes(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Tabla de habilidades del personaje
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS habilidades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            personaje_id INTEGER,
+            nombre TEXT NOT NULL,
+            atributo TEXT DEFAULT 'inteligencia',
+            rango INTEGER DEFAULT 1,
+            entrenamiento TEXT DEFAULT 'Básico',
+            FOREIGN KEY (personaje_id) REFERENCES personajes(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Biblioteca de objetos predefinidos
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS objetos_predefinidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            tipo TEXT DEFAULT 'Misc',
+            peso REAL DEFAULT 0,
+            valor INTEGER DEFAULT 0,
+            descripcion TEXT,
+            imagen TEXT
+        )
+    ''')
+
+    # Biblioteca de habilidades predefinidas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS habilidades_predefinidas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            clase TEXT,
+            nivel_minimo INTEGER DEFAULT 1,
+            entrenamiento TEXT DEFAULT 'Básico',
+            atributo TEXT DEFAULT 'inteligencia'
+        )
+    ''')
+
+    # Biblioteca de armaduras predefinidas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS armor_predefinidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            tipo TEXT DEFAULT 'Ligera',
+            defensa INTEGER DEFAULT 0,
+            peso REAL DEFAULT 0,
+            valor INTEGER DEFAULT 0,
+            descripcion TEXT,
+            imagen TEXT
+        )
+    ''')
+
+    # Biblioteca de armas predefinidas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS weapons_predefinidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            tipo TEXT DEFAULT 'Light melee',
+            clase TEXT DEFAULT 'Simple',
+            damage TEXT DEFAULT '1d6',
+            crit_rango INTEGER DEFAULT 20,
+            crit_mult INTEGER DEFAULT 2,
+            peso REAL DEFAULT 0,
+            valor INTEGER DEFAULT 0,
+            descripcion TEXT,
+            imagen TEXT
+        )
+    ''')
+
+
+def _add_missing_columns(conn):
+    """Bases de datos anteriores a las migraciones: añade las columnas que falten"""
+    for table, column, definition in ADDED_COLUMNS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_indexes(conn, indexes):
+    for table, columns in indexes:
+        name = f"idx_{table}_{'_'.join(columns)}"
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+
+def _base_schema(conn):
+    _create_tables(conn)
+    _add_missing_columns(conn)
+
+
+def _covering_indexes(conn):
+    # Sustituye al índice simple por personaje_id: sigue dando el inventario
+    # ordenado por id y los totales de carga (SUM de peso, cantidad y valor)
+    # se leen solo del índice
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventario_personaje_carga "
+                 "ON inventario (personaje_id, id, peso, cantidad, valor)")
+    conn.execute("DROP INDEX IF EXISTS idx_inventario_personaje_id")
+    # La defensa de la armadura equipada se busca por nombre sin distinguir mayúsculas
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_armor_predefinidos_nombre_nocase "
+                 "ON armor_predefinidos (nombre COLLATE NOCASE)")
+
+
+def _library_versions(conn):
+    # Versión de cada biblioteca compartida por todos los procesos: la caché
+    # de cada worker la compara para saber si otro worker ha escrito
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS library_versions (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for table in LIBRARY_TABLES:
+        conn.execute("INSERT OR IGNORE INTO library_versions (tabla) VALUES (?)", (table,))
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{evento.lower()} AFTER {evento} ON {table}
+                BEGIN
+                    UPDATE library_versions SET version = version + 1 WHERE tabla = '{table}';
+                END
+            ''')
+
+
+def _move_images(conn):
+    migrated = migrate_data_urls(conn)
+    if migrated:
+        print(f"🖼️  {migrated} imágenes movidas al almacén de imágenes")
+
+
+def _image_variants(conn):
+    # Miniatura y tarjeta se derivan de la URL de la variante completa; con
+    # columnas generadas los listados las incluyen sin tocar las escrituras.
+    # Para imágenes sin variantes (externas, SVG) valen la imagen original.
+    for table in IMAGE_TABLES:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+        for column, variant in (("miniatura", "thumb"), ("tarjeta", "card")):
+            if column not in existing:
+                conn.execute(f"""
+                    ALTER TABLE {table} ADD COLUMN {column} TEXT GENERATED ALWAYS AS (
+                        CASE WHEN imagen GLOB '*-full.webp'
+                             THEN substr(imagen, 1, length(imagen) - 10) || '-{variant}.webp'
+                             ELSE imagen END
+                    ) VIRTUAL
+                """)
+    ingested = ingest_stored_images(conn)
+    if ingested:
+        print(f"🖼️  {ingested} imágenes convertidas a variantes WebP")
+
+
+# (versión, descripción, función). Solo se añaden al final; nunca se editan
+# las ya publicadas. Todas toleran esquemas creados antes de user_version.
+MIGRATIONS = (
+    (1, "tablas base y columnas añadidas", _base_schema),
+    (2, "estadísticas derivadas materializadas", stats.create_table),
+    (3, "índices de texto completo (FTS5)", fts.create_schema),
+    (4, "índices de las bibliotecas", lambda conn: _create_indexes(conn, LIBRARY_INDEXES)),
+    (5, "índices por personaje de inventario y habilidades", lambda conn: _create_indexes(conn, (
+        ("inventario", ("personaje_id",)),
+        ("habilidades", ("personaje_id",)),
+    ))),
+    (6, "imágenes en data URL al almacén de imágenes", _move_images),
+    (7, "índices de cobertura de carga y de armaduras por nombre", _covering_indexes),
+    (8, "versiones de las bibliotecas compartidas entre procesos", _library_versions),
+    (9, "variantes WebP de las imágenes (miniatura y tarjeta)", _image_variants),
+    (10, "estadísticas de los personajes que aún no las tenían", stats.backfill),
+)
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Aplica las migraciones pendientes; devuelve cuántas se aplicaron"""
+    if current_version(conn) >= LATEST:
+        return 0
+    aplicadas = 0
+    for version, descripcion, migracion in MIGRATIONS:
+        with transaction(conn):
+            # Otro proceso puede haberla aplicado mientras esperábamos el bloqueo
+            if current_version(conn) >= version:
+                continue
+            migracion(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        print(f"🔧 Migración {version}: {descripcion}")
+        aplicadas += 1
+    return aplicadas
+
+
+if __name__ == "__main__":
+    # Migración previa al despliegue, antes de arrancar los workers
+    from pathfinder_db import connect
+
+    conn = connect()
+    try:
+        aplicadas = migrate(conn)
+        print(f"✅ Esquema en la versión {current_version(conn)} ({aplicadas} migraciones aplicadas)")
+    finally:
+        conn.close()
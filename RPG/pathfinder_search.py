@@ -0,0 +1,104 @@
+"""
+Pathfinder RPG - Búsqueda de texto completo (SQLite FTS5)
+Un índice FTS5 de contenido externo por tabla, mantenido por triggers, con
+búsqueda por prefijo ordenada por relevancia (bm25) y recuento por tipo.
+En una campaña se busca también en las bibliotecas del SRD adjunto.
+"""
+
+import re
+
+from pathfinder_db import LIBRARY_TABLES
+
+# tipo de resultado -> (tabla, columnas indexadas)
+FTS_SOURCES = {
+    "objetos": ("objetos_predefinidos", ("nombre", "descripcion")),
+    "armor": ("armor_predefinidos", ("nombre", "descripcion")),
+    "weapons": ("weapons_predefinidos", ("nombre", "descripcion")),
+    "habilidades-lib": ("habilidades_predefinidas", ("nombre", "clase")),
+    "personajes": ("personajes", ("nombre", "notas")),
+}
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def create_schema(conn):
+    """Crea los índices y sus triggers; rellena los que se acaban de crear"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, columns in FTS_SOURCES.values():
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{c}" for c in columns)
+        old_cols = ", ".join(f"old.{c}" for c in columns)
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END
+        ''')
+        # Solo los cambios en columnas indexadas tocan el índice (no hp_actual, oro...)
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+        if fts not in existing:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def build_query(texto):
+    """Convierte el texto del usuario en una consulta FTS5 segura.
+
+    Cada palabra se cita (sin operadores FTS del usuario) y se busca como
+    prefijo; todas deben aparecer.
+    """
+    tokens = _TOKEN.findall(texto or "")
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def _sources(conn, table):
+    """(esquema, signo del id) donde buscar: el propio fichero y, en una
+    campaña, el SRD adjunto con los ids negados como en sus vistas"""
+    yield "main", 1
+    if table in LIBRARY_TABLES and any(row[1] == "srd" for row in conn.execute("PRAGMA database_list")):
+        yield "srd", -1
+
+
+def search(conn, texto, tipos=None, limit=20):
+    """Busca en los índices; devuelve (resultados ordenados por relevancia, facetas)"""
+    query = build_query(texto)
+    if not query:
+        return [], {}
+    resultados = []
+    facetas = {}
+    for tipo, (table, columns) in FTS_SOURCES.items():
+        facetas[tipo] = 0
+        for schema, signo in _sources(conn, table):
+            fts = f"{table}_fts"
+            total = conn.execute(f"SELECT count(*) FROM {schema}.{fts} WHERE {fts} MATCH ?", (query,)).fetchone()[0]
+            facetas[tipo] += total
+            if not total or (tipos and tipo not in tipos):
+                continue
+            rows = conn.execute(f'''
+                SELECT t.id * {signo} AS id, t.nombre, snippet({fts}, -1, '<b>', '</b>', '…', 12) AS fragmento,
+                       {fts}.rank AS rank
+                FROM {schema}.{fts} JOIN {schema}.{table} t ON t.id = {fts}.rowid
+                WHERE {fts} MATCH ?
+                ORDER BY {fts}.rank
+                LIMIT ?
+            ''', (query, limit)).fetchall()
+            resultados.extend({"tipo": tipo, **dict(row)} for row in rows)
+    # rank (bm25 por defecto) es menor cuanto más relevante; ordenar por la
+    # columna oculta deja el orden a FTS5 sin B-tree temporal
+    resultados.sort(key=lambda r: r["rank"])
+    return resultados[:limit], facetas
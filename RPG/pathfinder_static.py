@@ -0,0 +1,139 @@
+"""
+Pathfinder RPG - Entrega del frontend
+El CSS y el JS que van dentro de pathfinder_web_fastapi.html se separan al
+arrancar en ficheros con el hash del contenido en el nombre, y cada fichero
+se comprime una sola vez con gzip (y brotli si el paquete está instalado).
+Los ficheros no caducan nunca; el HTML se revalida con ETag, de modo que una
+visita repetida se queda en un 304 sin cuerpo.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+from fastapi.responses import Response
+
+from pathfinder_cache import etag_matches
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin él solo se ofrece gzip
+    brotli = None
+
+HTML_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pathfinder_web_fastapi.html")
+
+STATIC_PREFIX = "/static/"
+
+# El nombre cambia con el contenido: la caché del navegador no necesita revalidar
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Solo los bloques inline, sin atributos (<script src=...> se queda como está)
+_STYLE = re.compile(r"<style>(.*?)</style>", re.S)
+_SCRIPT = re.compile(r"<script>(.*?)</script>", re.S)
+
+
+def _accepted(accept_encoding):
+    """Codificaciones aceptadas por el cliente (las de q=0 no cuentan)"""
+    aceptadas = set()
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, params = parte.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if nombre.strip() and q > 0:
+            aceptadas.add(nombre.strip())
+    if "*" in aceptadas:
+        aceptadas.update(("br", "gzip"))
+    return aceptadas
+
+
+class Asset:
+    """Un recurso estático con sus variantes precomprimidas"""
+    __slots__ = ("media_type", "variants", "etags")
+
+    def __init__(self, body, media_type):
+        self.media_type = media_type
+        self.variants = {"identity": body}
+        gz = gzip.compress(body, 9, mtime=0)
+        if len(gz) < len(body):
+            self.variants["gzip"] = gz
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            if len(br) < len(body):
+                self.variants["br"] = br
+        # ETag distinto por variante: son representaciones distintas
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.etags = {enc: f'"{digest}"' if enc == "identity" else f'"{digest}-{enc}"' for enc in self.variants}
+
+    def negotiate(self, accept_encoding):
+        """Variante más pequeña que acepta el cliente: (codificación, cuerpo)"""
+        aceptadas = _accepted(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in aceptadas:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+    def matches(self, if_none_match):
+        return etag_matches(if_none_match, self.etags.values())
+
+
+class Frontend:
+    """HTML con el CSS y el JS extraídos a recursos con hash.
+
+    Se reconstruye si el HTML cambia en disco. Los recursos de versiones
+    anteriores se conservan para las páginas que ya los tienen enlazados.
+    """
+
+    def __init__(self, path=HTML_FILE):
+        self.path = path
+        self.html = None
+        self.assets = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _extract(self, match, extension, media_type, tag):
+        body = match.group(1).encode("utf-8")
+        name = f"app.{hashlib.sha256(body).hexdigest()[:16]}.{extension}"
+        if name not in self.assets:
+            self.assets[name] = Asset(body, media_type)
+        return tag.format(STATIC_PREFIX + name)
+
+    def _build(self):
+        with open(self.path, encoding="utf-8") as f:
+            html = f.read()
+        html = _STYLE.sub(lambda m: self._extract(m, "css", "text/css; charset=utf-8",
+                                                  '<link rel="stylesheet" href="{}">'), html)
+        html = _SCRIPT.sub(lambda m: self._extract(m, "js", "text/javascript; charset=utf-8",
+                                                   '<script src="{}"></script>'), html)
+        self.html = Asset(html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def current(self):
+        """Asset del HTML, reconstruido si el fichero ha cambiado"""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._build()
+                    self._mtime = mtime
+        return self.html
+
+    def asset(self, name):
+        self.current()
+        return self.assets.get(name)
+
+
+def response(asset, request, cache_control):
+    """Respuesta con la variante negociada por Accept-Encoding, o 304"""
+    encoding, body = asset.negotiate(request.headers.get("accept-encoding", ""))
+    headers = {"ETag": asset.etags[encoding], "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if asset.matches(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=asset.media_type, headers=headers)
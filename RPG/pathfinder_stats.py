@@ -0,0 +1,153 @@
+"""
+Pathfinder RPG - Estadísticas derivadas
+Modificadores, totales de habilidad, defensa y carga calculados en el
+servidor y materializados en personaje_stats. Solo se recalculan cuando
+cambia el personaje afectado o la armadura que lleva equipada; las
+lecturas devuelven el valor guardado.
+"""
+
+import json
+import re
+
+ATRIBUTOS = ("fuerza", "destreza", "constitucion", "inteligencia", "sabiduria", "carisma")
+
+# Columnas de personajes de las que dependen las estadísticas derivadas
+DEPENDENCIAS = frozenset(ATRIBUTOS + ("equip_armadura", "equip_escudo"))
+
+# Defensa base de Pathfinder antes de armadura, escudo y destreza
+DEFENSA_BASE = 10
+
+# Capacidad de carga en libras por punto de fuerza (igual que el frontend)
+CARGA_POR_FUERZA = 5
+
+_DEFENSA_EN_DESCRIPCION = re.compile(r"Defensa:\s*\+?(-?\d+)")
+
+
+def create_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS personaje_stats (
+            personaje_id INTEGER PRIMARY KEY,
+            datos TEXT NOT NULL,
+            FOREIGN KEY (personaje_id) REFERENCES personajes(id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def modifier(score):
+    """Modificador de característica: (puntuación - 10) / 2, redondeando hacia abajo"""
+    return ((score if score is not None else 10) - 10) // 2
+
+
+def _defensa_item(conn, item_id, personaje_id):
+    """Bonificador de defensa de un objeto equipado del inventario"""
+    if item_id is None:
+        return 0
+    item = conn.execute(
+        "SELECT item, descripcion FROM inventario WHERE id = ? AND personaje_id = ?",
+        (item_id, personaje_id),
+    ).fetchone()
+    if item is None:
+        return 0
+    # El inventario guarda una copia del objeto: la defensa se busca por nombre
+    # en la biblioteca de armaduras y, si ya no existe, en la descripción
+    armor = conn.execute(
+        "SELECT defensa FROM armor_predefinidos WHERE nombre = ? COLLATE NOCASE LIMIT 1",
+        (item["item"],),
+    ).fetchone()
+    if armor is not None:
+        return armor["defensa"] or 0
+    match = _DEFENSA_EN_DESCRIPCION.search(item["descripcion"] or "")
+    return int(match.group(1)) if match else 0
+
+
+def compute(conn, personaje_id):
+    """Calcula las estadísticas derivadas de un personaje (None si no existe)"""
+    p = conn.execute("SELECT * FROM personajes WHERE id = ?", (personaje_id,)).fetchone()
+    if p is None:
+        return None
+    keys = p.keys()
+    modificadores = {attr: modifier(p[attr]) for attr in ATRIBUTOS}
+
+    habilidades = []
+    for h in conn.execute(
+        "SELECT id, nombre, atributo, rango FROM habilidades WHERE personaje_id = ? ORDER BY id",
+        (personaje_id,),
+    ):
+        mod = modificadores.get(h["atributo"], 0)
+        habilidades.append({"id": h["id"], "nombre": h["nombre"], "rango": h["rango"] or 0,
+                            "modificador": mod, "total": (h["rango"] or 0) + mod})
+
+    armadura = _defensa_item(conn, p["equip_armadura"], personaje_id) if "equip_armadura" in keys else 0
+    escudo = _defensa_item(conn, p["equip_escudo"], personaje_id) if "equip_escudo" in keys else 0
+
+    carga = conn.execute(
+        "SELECT COALESCE(SUM(peso * cantidad), 0) AS peso, COALESCE(SUM(valor * cantidad), 0) AS valor "
+        "FROM inventario WHERE personaje_id = ?",
+        (personaje_id,),
+    ).fetchone()
+    capacidad = (p["fuerza"] or 10) * CARGA_POR_FUERZA
+
+    return {
+        "modificadores": modificadores,
+        "habilidades": habilidades,
+        "defensa": {
+            "total": DEFENSA_BASE + armadura + escudo + modificadores["destreza"],
+            "armadura": armadura,
+            "escudo": escudo,
+            "destreza": modificadores["destreza"],
+        },
+        "carga": {
+            "peso": carga["peso"],
+            "capacidad": capacidad,
+            "valor": carga["valor"],
+            # La suma en coma flotante de una carga justa puede pasarse por poco
+            "sobrecargado": carga["peso"] > capacidad + 1e-6,
+        },
+    }
+
+
+def refresh(conn, personaje_id):
+    """Recalcula y guarda las estadísticas; llamar dentro de la transacción de escritura"""
+    stats = compute(conn, personaje_id)
+    if stats is None:
+        return None
+    conn.execute(
+        "INSERT OR REPLACE INTO personaje_stats (personaje_id, datos) VALUES (?, ?)",
+        (personaje_id, json.dumps(stats, separators=(",", ":"))),
+    )
+    return stats
+
+
+def refresh_armor(conn, nombres):
+    """Recalcula a quien lleve equipada una armadura o escudo con esos nombres.
+
+    La defensa se busca por nombre en la biblioteca: llamar dentro de la
+    transacción que la escribe, con los nombres anteriores y los nuevos.
+    """
+    nombres = sorted({n for n in nombres if n})
+    if not nombres:
+        return 0
+    ids = [row[0] for row in conn.execute(f"""
+        SELECT DISTINCT p.id FROM personajes p
+        JOIN inventario i ON i.id IN (p.equip_armadura, p.equip_escudo) AND i.personaje_id = p.id
+        WHERE i.item COLLATE NOCASE IN ({', '.join('?' * len(nombres))})
+    """, nombres)]
+    for personaje_id in ids:
+        refresh(conn, personaje_id)
+    return len(ids)
+
+
+def backfill(conn):
+    """Materializa las estadísticas de los personajes que aún no las tienen"""
+    for (personaje_id,) in conn.execute(
+        "SELECT id FROM personajes WHERE id NOT IN (SELECT personaje_id FROM personaje_stats)"
+    ).fetchall():
+        refresh(conn, personaje_id)
+
+
+def get(conn, personaje_id):
+    """Estadísticas materializadas; sin escribir si aún no existen"""
+    row = conn.execute("SELECT datos FROM personaje_stats WHERE personaje_id = ?", (personaje_id,)).fetchone()
+    if row is not None:
+        return json.loads(row["datos"])
+    return compute(conn, personaje_id)
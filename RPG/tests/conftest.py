@@ -0,0 +1,35 @@
+"""
+Fixtures comunes: la API sobre una base de datos nueva en un directorio
+temporal, sin pools de procesos
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Antes de importar ningún módulo: las rutas se fijan al importar pathfinder_db
+DATOS = tempfile.mkdtemp(prefix="pathfinder-tests-")
+os.environ["PATHFINDER_DB"] = os.path.join(DATOS, "pathfinder_fastapi.db")
+os.environ["PATHFINDER_CAMPAIGNS"] = os.path.join(DATOS, "campanas")
+os.environ["PATHFINDER_IMAGES"] = os.path.join(DATOS, "imagenes")
+os.environ["PATHFINDER_IMAGE_WORKERS"] = "0"
+os.environ["PATHFINDER_SIM_WORKERS"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import pathfinder_api
+
+    with TestClient(pathfinder_api.app) as client:
+        yield client
+
+
+@pytest.fixture
+def personaje(client):
+    return client.post("/api/personajes", json={"nombre": "Prueba"}).json()["id"]
@@ -0,0 +1,51 @@
+"""Reintentos ante una base de datos bloqueada"""
+
+import sqlite3
+
+import pytest
+
+from pathfinder_db import connect, run_with_retry, transaction
+
+BLOQUEADA = sqlite3.OperationalError("database is locked")
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / "retry.db"))
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    yield conn
+    conn.close()
+
+
+def filas(conn):
+    return conn.execute("SELECT count(*) FROM t").fetchone()[0]
+
+
+def test_repite_lo_no_confirmado(conn):
+    llamadas = []
+
+    def escribir(conn):
+        llamadas.append(1)
+        with transaction(conn):
+            conn.execute("INSERT INTO t VALUES (1)")
+            if len(llamadas) == 1:
+                raise BLOQUEADA
+
+    run_with_retry(escribir, conn)
+    assert len(llamadas) == 2
+    assert filas(conn) == 1
+
+
+def test_no_repite_lo_confirmado(conn):
+    llamadas = []
+
+    def escribir_y_fallar(conn):
+        llamadas.append(1)
+        with transaction(conn):
+            conn.execute("INSERT INTO t VALUES (1)")
+        raise BLOQUEADA
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_with_retry(escribir_y_fallar, conn)
+    assert len(llamadas) == 1
+    assert filas(conn) == 1
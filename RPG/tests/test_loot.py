@@ -0,0 +1,23 @@
+"""Reparto de botín"""
+
+import pathfinder_loot as loot
+
+
+def test_peso_negativo_cuenta_como_cero():
+    reparto = loot.solve([(-1.0, 10, 2), (3.0, 5, 1)], [10.0], 0.1)
+    assert reparto["asignacion"] == [{0: 2, 1: 1}]
+    assert reparto["valor"] == 25
+    assert reparto["optimo"]
+
+
+def test_capacidad_exacta():
+    reparto = loot.solve([(0.1, 1, 100)], [5.0], 0.1)
+    assert reparto["asignacion"] == [{0: 50}]
+
+
+def test_reparto_con_peso_negativo(client, personaje):
+    objeto = client.post("/api/objetos", json={"nombre": "Pluma", "peso": -1, "valor": 3}).json()["id"]
+    r = client.post("/api/botin/reparto", json={"botin": [{"biblioteca": "objetos", "id": objeto, "cantidad": 2}],
+                                               "personajes": [personaje], "aplicar": False})
+    assert r.status_code == 200
+    assert r.json()["valor_total"] == 6
@@ -0,0 +1,15 @@
+"""Planes de consulta: ningún endpoint recorre tablas enteras ni ordena con B-tree temporal"""
+
+import os
+import subprocess
+import sys
+
+RPG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_sin_recorridos_completos():
+    # En un proceso aparte: la comprobación usa su propia base de datos sintética
+    r = subprocess.run([sys.executable, "-m", "benchmarks.check_query_plans",
+                        "--personajes", "2000", "--inventario", "20000"],
+                       cwd=RPG_DIR, capture_output=True, text=True, timeout=600)
+    assert r.returncode == 0, r.stdout + r.stderr
@@ -0,0 +1,16 @@
+"""Búsqueda de texto completo"""
+
+
+def test_campana_incluye_el_srd(client):
+    srd = client.post("/api/objetos", json={"nombre": "Linterna sorda"}).json()["id"]
+    assert client.post("/api/campanas", json={"nombre": "busqueda"}).status_code == 201
+    propio = client.post("/api/campanas/busqueda/objetos", json={"nombre": "Linterna rota"}).json()["id"]
+
+    r = client.get("/api/campanas/busqueda/search", params={"q": "linterna", "tipo": "objetos"}).json()
+    assert sorted(o["id"] for o in r["resultados"]) == sorted([propio, -srd])
+    assert r["facetas"]["objetos"] == 2
+    listado = client.get("/api/campanas/busqueda/objetos").json()
+    assert {o["id"] for o in r["resultados"]} <= {o["id"] for o in listado}
+
+    r = client.get("/api/search", params={"q": "linterna", "tipo": "objetos"}).json()
+    assert [o["id"] for o in r["resultados"]] == [srd]
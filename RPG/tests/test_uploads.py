@@ -0,0 +1,47 @@
+"""Imágenes subidas en lotes e importaciones: se validan antes de decodificarlas"""
+
+import json
+
+NDJSON = {"content-type": "application/x-ndjson"}
+
+
+def ndjson(*lineas):
+    return "".join(json.dumps(linea) + "\n" for linea in lineas)
+
+
+def test_batch_imagen_no_texto(client, personaje):
+    r = client.post("/api/batch", json={"operaciones": [
+        {"op": "inventario.create", "datos": {"personaje_id": personaje, "item": "Daga"}},
+        {"op": "inventario.create", "datos": {"personaje_id": personaje, "item": "Gema", "imagen": 123}},
+    ]})
+    assert r.status_code == 422
+    assert r.json()["detail"]["operacion"] == 1
+    assert client.get(f"/api/inventario/{personaje}").json() == []
+
+
+def test_batch_imagen_no_valida(client, personaje):
+    r = client.post("/api/batch", json={"operaciones": [
+        {"op": "inventario.create", "datos": {"personaje_id": personaje, "item": "Gema",
+                                              "imagen": "data:image/svg+xml;base64,PHN2Zy8+"}},
+    ]})
+    assert r.status_code == 400
+    assert r.json()["detail"]["operacion"] == 0
+
+
+def test_bulk_biblioteca_imagen_no_texto(client):
+    r = client.post("/api/bulk/objetos", content=ndjson({"nombre": "x", "imagen": 5}, {"nombre": "y"}),
+                    headers=NDJSON)
+    assert r.status_code == 200
+    assert r.json()["insertadas"] == 1
+    assert [e["linea"] for e in r.json()["errores"]] == [1]
+
+
+def test_bulk_personajes_imagen_no_texto(client):
+    r = client.post("/api/bulk/personajes", content=ndjson(
+        {"nombre": "A", "inventario": [{"item": "Gema", "imagen": 5}]},
+        {"nombre": "B", "inventario": "no es una lista"},
+        {"nombre": "C", "inventario": [{"item": "Daga"}]},
+    ), headers=NDJSON)
+    assert r.status_code == 200
+    assert r.json()["insertadas"] == 1
+    assert [e["linea"] for e in r.json()["errores"]] == [1, 2]